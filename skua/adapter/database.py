@@ -1,46 +1,85 @@
-class ABCDatabase:
-    operators = [">", "<", ">=", "<=", "="]
-    blob = "BLOB"
+import threading
+from contextlib import contextmanager, nullcontext
+from time import time
+from .pool import ConnectionPool, Checkout
+from ..cache import LRUCache
+
+
+class Operator(str):
+    # A comparison made by gt()/ge()/lt()/le(). It still reads as the old
+    # SQL fragment, e.g. ">5", but the builders bind `value` as a query
+    # parameter instead of inlining it.
+    def __new__(cls, op, value):
+        operator = super().__new__(cls, f"{op}{value}")
+        operator.op = op
+        operator.value = value
+        return operator
+
+    def __getnewargs__(self):
+        return (self.op, self.value)
+
+
+class PendingCommit:
+    # Statements one thread has left uncommitted under group commit. The
+    # interval timer commits them from another thread, so the count, the
+    # connection and the timer live together behind `lock`.
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.count = 0
+        self.since = 0.0
+        self.conn = None
+        self.timer = None
 
-    @classmethod
-    def string_ensure(cls, value):
-        if isinstance(value, str):
-            return f'\"{value}\"'
-        else:
-            return f'{value}'
 
-    @classmethod
-    def ensure_operator(cls, value):
-        if isinstance(value, str):
-            if value[:1] in cls.operators or\
-                    value[:2] in cls.operators:
-                    return value
-        return cls.eq(value)
+class ABCDatabase:
+    blob = "BLOB"
+    # Number of distinct statement texts remembered per adapter.
+    SQL_CACHE_SIZE = 256
+    insert_ignore = "INSERT IGNORE"
+    lock_clause = " FOR UPDATE SKIP LOCKED"
+    # Other names the primary key comes back under in rows.
+    ID_ALIASES = ()
 
     @classmethod
     def eq(cls, value):
-        return "=" + cls.string_ensure(value)
+        return Operator("=", value)
 
     @classmethod
     def gt(cls, value):
-        return f">{value}"
+        return Operator(">", value)
 
     @classmethod
     def ge(cls, value):
-        return f">={value}"
+        return Operator(">=", value)
 
     @classmethod
     def lt(cls, value):
-        return f"<{value}"
+        return Operator("<", value)
 
     @classmethod
     def le(cls, value):
-        return f"<={value}"
+        return Operator("<=", value)
 
-    def __init__(self):
+    def __init__(self, max_connections=1, min_connections=1,
+                 idle_timeout=None, pool_timeout=None):
         self._conn = None
         self._cursor = None
         self._connected = False
+        # With max_connections > 1 every thread checks out a connection
+        # of its own from a pool; otherwise one connection is shared.
+        self._max_connections = max_connections
+        self._min_connections = min(min_connections, max_connections)
+        self._idle_timeout = idle_timeout
+        self._pool_timeout = pool_timeout
+        self._pool = None
+        self._local = threading.local()
+        # Statements only depend on the shape of a call (table, columns,
+        # operators), never on the values, so their text is memoized.
+        self._sql_cache = LRUCache(max_entries=self.SQL_CACHE_SIZE)
+        # Group commit: outside a transaction, commit only every
+        # `_commit_every` statements or `_commit_interval` seconds.
+        self._commit_every = None
+        self._commit_interval = None
 
     def connect(self):
         raise NotImplementedError
@@ -48,84 +87,171 @@ class ABCDatabase:
     def close(self):
         raise NotImplementedError
 
-    def _reconnect(self):
+    def _new_connection(self):
         raise NotImplementedError
 
-    def _dict_to_find_sql(self, table, fields, orderby=None, asc=True,
-                          limit=None, offset=0):
+    def _reconnect(self):
+        self._conn = self._new_connection()
+
+    def _conn_open(self, conn):
+        return True
+
+    @property
+    def pooled(self):
+        return self._max_connections > 1
+
+    @property
+    def thread_safe(self):
+        # A shared DB-API connection must not be used by several threads.
+        return self.pooled
+
+    @property
+    def concurrent_reads(self):
+        # Whether several threads can read at the same time, rather than
+        # queueing on one connection.
+        return self.pooled
+
+    def _start_pool(self):
+        self._pool = ConnectionPool(self._new_connection,
+                                    max_size=self._max_connections,
+                                    min_size=self._min_connections,
+                                    is_open=self._conn_open,
+                                    idle_timeout=self._idle_timeout,
+                                    timeout=self._pool_timeout)
+        self._pool.fill()
+
+    def _checkout(self):
+        checkout = getattr(self._local, "checkout", None)
+        if checkout is None or checkout.conn is None or \
+                not self._conn_open(checkout.conn):
+            if checkout is not None:
+                checkout.release()
+            checkout = self._local.checkout = Checkout(self._pool)
+        return checkout
+
+    def release(self):
+        # Give the calling thread's pooled connection back early, instead
+        # of when the thread exits.
+        checkout = getattr(self._local, "checkout", None)
+        if checkout is not None:
+            checkout.release()
+            self._local.checkout = None
+
+    def _where_shape(self, fields):
+        # The shape of a WHERE clause: column, operator and whether the
+        # bound value is binary. Values never end up in the SQL text.
         if not isinstance(fields, dict):
             raise TypeError("Dict required.")
+        shape = []
+        for key, value in fields.items():
+            op = "="
+            if isinstance(value, Operator):
+                op, value = value.op, value.value
+            shape.append((key, op, isinstance(value, bytes)))
+        return tuple(shape)
+
+    def _where_args(self, fields):
+        return {f"w_{key}": value.value if isinstance(value, Operator)
+                else value for key, value in fields.items()}
+
+    def _update_args(self, update, where):
+        args = {f"s_{key}": value for key, value in update.items()}
+        args.update(self._where_args(where))
+        return args
+
+    def _where_sql(self, shape):
+        if not shape:
+            return ""
+        conditions = []
+        for key, op, binary in shape:
+            placeholder = self._placeholder(f"w_{key}",
+                                            b"" if binary else None)
+            conditions.append(f"{key} {op} {placeholder}")
+        return " WHERE " + " AND ".join(conditions)
+
+    def _sql(self, *shape):
+        # Not functools.lru_cache: around a bound method it would keep
+        # the adapter alive through a reference cycle.
+        hit, sql = self._sql_cache.get(shape)
+        if not hit:
+            sql = self._build_sql(*shape)
+            self._sql_cache.put(shape, sql)
+        return sql
+
+    def _build_sql(self, kind, *shape):
+        return getattr(self, f"_build_{kind}_sql")(*shape)
+
+    def _dict_to_find_sql(self, table, fields, orderby=None, asc=True,
+                          limit=None, offset=0, columns="*"):
         if orderby and not isinstance(orderby, list):
             orderby = [orderby]
         if not isinstance(offset, int):
             raise TypeError("Offset should be a number.")
+        return self._sql("find", table, self._where_shape(fields),
+                         tuple(orderby or ()), asc, limit, offset, columns)
 
+    def _build_find_sql(self, table, where, orderby, asc, limit, offset,
+                        columns):
         offset_str = "" if limit is None else f" LIMIT {limit} OFFSET {offset}"
-
-        fields_str = " WHERE "
-        for key, value in fields.items():
-            fields_str += f" {key} {ABCDatabase.ensure_operator(value)} AND"
-        fields_str = fields_str[:-3] if fields else ""
-
         if orderby:
-            order_str = " ORDER BY "
-            for name in orderby:
-                order_str += f" {name},"
-            order_str = order_str[:-1]
-            order_str += " ASC " if asc else " DESC "
+            direction = "ASC" if asc else "DESC"
+            order_str = " ORDER BY " + ", ".join(f"{name} {direction}"
+                                                 for name in orderby)
         else:
             order_str = ""
+        return f"SELECT {columns} FROM {table}" + self._where_sql(where) + \
+            order_str + offset_str
 
-        return f"SELECT * FROM {table} " + fields_str + order_str + offset_str
+    def _columns_sql(self, columns=None):
+        return ", ".join(columns) if columns else "*"
 
     def _dict_to_insert_sql(self, table, fields):
         if not isinstance(fields, dict):
             raise TypeError("Dict required.")
-
-        key_str = ""
-        value_str = ""
-        for key in fields.keys():
-            key_str += f" {key},"
-            value_str += f" %({key})s,"
-
-        return f"INSERT INTO {table} ({key_str[:-1]}) VALUES \
-            ({value_str[:-1]})"
+        return self._sql("insert", table, tuple(fields.keys()))
 
     def _list_to_insert_many_sql(self, table, fields):
         if not isinstance(fields, list):
             raise TypeError("List required.")
+        return self._sql("insert", table, tuple(fields[0].keys()))
 
-        key_str = ""
-        value_str = ""
-        for key in fields[0].keys():
-            key_str += f" {key},"
-            value_str += f" %({key})s,"
-
-        return f"INSERT INTO {table} ({key_str[:-1]}) VALUES \
-            ({value_str[:-1]})"
+    def _build_insert_sql(self, table, keys):
+        key_str = ", ".join(keys)
+        value_str = ", ".join(self._placeholder(key) for key in keys)
+        return f"INSERT INTO {table} ({key_str}) VALUES ({value_str})"
 
     def _dict_to_update_sql(self, table, update, where):
         if not isinstance(update, dict) or not isinstance(where, dict):
             raise TypeError("Dict required.")
+        columns = tuple((key, isinstance(value, bytes))
+                        for key, value in update.items())
+        return self._sql("update", table, columns, self._where_shape(where))
 
-        update_str = ""
-        where_str = ""
-        for key, value in update.items():
-            update_str += f"{key}='{value}',"
+    def _build_update_sql(self, table, columns, where):
+        update_str = ", ".join(
+            f"{key}={self._placeholder(f's_{key}', b'' if binary else None)}"
+            for key, binary in columns)
+        return f"UPDATE {table} SET {update_str}" + self._where_sql(where)
+
+    def _dict_to_delete_sql(self, table, fields=None):
+        return self._sql("delete", table, self._where_shape(fields or {}))
 
-        for key, value in where.items():
-            where_str += f" {key} {ABCDatabase.ensure_operator(value)} AND"
+    def _build_delete_sql(self, table, where):
+        return f"DELETE FROM {table}" + self._where_sql(where)
 
-        return f"UPDATE {table} SET {update_str[:-1]} WHERE {where_str[:-3]}"
+    def _ids_to_delete_sql(self, table, ids):
+        return self._in_delete_sql(table, self.ID, len(ids))
 
-    def _dict_to_delete_sql(self, table, fields=None):
-        if not fields:
-            return f"DELETE FROM {table}"
+    def _in_delete_sql(self, table, field, count):
+        return self._sql("delete_in", table, field, count)
 
-        sql = f"DELETE FROM {table} WHERE "
-        for key, value in fields.items():
-            sql += f" {key} {ABCDatabase.ensure_operator(value)} AND"
-        return sql[:-3]
+    def _build_delete_in_sql(self, table, field, count):
+        in_str = ", ".join(self._placeholder(f"in_{i}")
+                           for i in range(count))
+        return f"DELETE FROM {table} WHERE {field} IN ({in_str})"
+
+    def _in_args(self, values):
+        return {f"in_{i}": value for i, value in enumerate(values)}
 
     def _table_to_sql(self, table, fields):
         field_str = "id MEDIUMINT NOT NULL AUTO_INCREMENT PRIMARY KEY,"
@@ -134,6 +260,55 @@ class ABCDatabase:
         field_str = field_str[:-1]
         return f"CREATE  TABLE {table} ({field_str})"
 
+    def _placeholder(self, key, value=None):
+        return f"%({key})s"
+
+    def _value_shape(self, fields):
+        return tuple((key, isinstance(value, bytes))
+                     for key, value in fields.items())
+
+    def _values_sql(self, columns):
+        return ", ".join(self._placeholder(key, b"" if binary else None)
+                         for key, binary in columns)
+
+    def _dict_to_upsert_sql(self, table, fields, keys):
+        if not isinstance(fields, dict):
+            raise TypeError("Dict required.")
+        return self._sql("upsert", table, self._value_shape(fields),
+                         tuple(keys))
+
+    def _build_upsert_sql(self, table, columns, keys):
+        key_str = ", ".join(key for key, _ in columns)
+        update_str = ", ".join(f"{key}=VALUES({key})"
+                               for key, _ in columns if key not in keys)
+        # Re-assigning a key column turns a key-only upsert into a no-op.
+        update_str = update_str or f"{keys[0]}={keys[0]}"
+
+        return f"INSERT INTO {table} ({key_str}) VALUES \
+            ({self._values_sql(columns)}) ON DUPLICATE KEY UPDATE {update_str}"
+
+    def _dict_to_insert_ignore_sql(self, table, fields):
+        if not isinstance(fields, dict):
+            raise TypeError("Dict required.")
+        return self._sql("insert_ignore", table, self._value_shape(fields))
+
+    def _build_insert_ignore_sql(self, table, columns):
+        key_str = ", ".join(key for key, _ in columns)
+        return f"{self.insert_ignore} INTO {table} ({key_str}) VALUES \
+            ({self._values_sql(columns)})"
+
+    def _index_name(self, table, fields):
+        return f"{table}_{'_'.join(fields)}_idx"
+
+    def _create_index_sql(self, table, fields, unique=False):
+        index = self._index_name(table, fields)
+        unique_str = "UNIQUE " if unique else ""
+        return f"CREATE {unique_str}INDEX {index} ON {table} \
+            ({', '.join(fields)})"
+
+    def _index_exist_sql(self, table, index):
+        raise NotImplementedError
+
     def _table_exist_sql(self, table):
         raise NotImplementedError
 
@@ -147,18 +322,10 @@ class ABCDatabase:
         return f"DROP TABLE {table}"
 
     def _count_sql(self, table, fields):
-        if not isinstance(fields, dict):
-            raise TypeError("Dict required.")
+        return self._sql("count", table, self._where_shape(fields))
 
-        sql = f"SELECT COUNT(*) FROM {table} "
-        if fields:
-            fields_str = "WHERE "
-            for key, value in fields.items():
-                fields_str += f" {key} {self.ensure_operator(value)} AND"
-            fields_str = fields_str[:-3]
-        else:
-            fields_str = ""
-        return sql + fields_str
+    def _build_count_sql(self, table, where):
+        return f"SELECT COUNT(*) FROM {table}" + self._where_sql(where)
 
     @property
     def is_open(self):
@@ -166,6 +333,8 @@ class ABCDatabase:
 
     @property
     def cursor(self):
+        if self._pool is not None:
+            return self._checkout().cursor
         if self._cursor is None:
             self._cursor = self.conn.cursor()
         return self._cursor
@@ -175,19 +344,140 @@ class ABCDatabase:
         if not self._connected:
             raise DatabaseError("Databse not connected.")
 
+        if self._pool is not None:
+            return self._checkout().conn
         if self._conn is None or not self.is_open:
             self._reconnect()
         return self._conn
 
+    def _close_pool(self):
+        self.release()
+        self._pool.close()
+
     def execute(self, sql, args={}):
-        rows = self.cursor.execute(sql, args)
-        self.conn.commit()
-        return rows
+        with self._pending().lock:
+            rows = self.cursor.execute(sql, args)
+            self._commit()
+            return rows
 
     def executemany(self, sql, args):
-        rows = self.cursor.executemany(sql, args)
-        self.conn.commit()
-        return rows
+        with self._pending().lock:
+            rows = self.cursor.executemany(sql, args)
+            self._commit()
+            return rows
+
+    @property
+    def in_transaction(self):
+        return getattr(self._local, "depth", 0) > 0
+
+    def _pending(self):
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            pending = self._local.pending = PendingCommit()
+        return pending
+
+    def _commit(self):
+        # Called after every statement, with the thread's PendingCommit
+        # locked. Inside transaction() the commit is left to the
+        # outermost block.
+        if self.in_transaction:
+            return
+        if self._commit_every is None and self._commit_interval is None:
+            self.conn.commit()
+            return
+
+        pending = self._pending()
+        now = time()
+        if not pending.count:
+            pending.since = now
+            pending.conn = self.conn
+            if self._commit_interval:
+                pending.timer = threading.Timer(
+                    self._commit_interval, self._commit_timer, (pending,))
+                pending.timer.daemon = True
+                pending.timer.start()
+        pending.count += 1
+        if (self._commit_every is not None and
+                pending.count >= self._commit_every) or \
+                (self._commit_interval is not None and
+                 now - pending.since >= self._commit_interval):
+            self._commit_pending(pending)
+
+    def _commit_pending(self, pending):
+        # With `pending.lock` held.
+        self._forget_pending(pending)
+        pending.conn.commit()
+        pending.conn = None
+
+    def _forget_pending(self, pending):
+        if pending.timer is not None:
+            pending.timer.cancel()
+            pending.timer = None
+        pending.count = 0
+
+    def _commit_timer(self, pending):
+        # Runs on the timer thread once the oldest deferred statement is
+        # `interval` seconds old, unless a commit came first.
+        with self._transaction_lock(), pending.lock:
+            if pending.count and self._connected:
+                self._commit_pending(pending)
+
+    def group_commit(self, every=None, interval=None):
+        # Commit every `every` statements or once the oldest uncommitted
+        # statement is `interval` seconds old, whichever comes first. A
+        # timer commits a thread's statements when they reach that age,
+        # even if the thread writes nothing more. Pass nothing to turn
+        # it off.
+        if every is not None and every < 1:
+            raise ValueError("'every' must be a positive number")
+        if interval is not None and interval < 0:
+            raise ValueError("'interval' must be a non-negative number")
+        self.flush()
+        self._commit_every = every
+        self._commit_interval = interval
+
+    def flush(self):
+        # Commit the statements deferred by group commit.
+        pending = self._pending()
+        with pending.lock:
+            if self.in_transaction or not pending.count:
+                return
+            self._commit_pending(pending)
+
+    def _transaction_lock(self):
+        return nullcontext()
+
+    def _begin(self, immediate=False):
+        self.conn.begin()
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        # Statements in the block are committed together on exit and
+        # rolled back if it raises. Nested blocks join the outer one.
+        if self.in_transaction:
+            self._local.depth += 1
+            try:
+                yield self
+            finally:
+                self._local.depth -= 1
+            return
+
+        with self._transaction_lock():
+            # Statements deferred by group commit join the transaction
+            # (or are committed by BEGIN), so the timer must leave them.
+            pending = self._pending()
+            with pending.lock:
+                self._begin(immediate)
+                self._local.depth = 1
+                self._forget_pending(pending)
+            try:
+                yield self
+            except BaseException:
+                self._local.depth = 0
+                self.conn.rollback()
+                raise
+            self._local.depth = 0
+            self.conn.commit()
 
     def db_exist(self, db):
         sql = self._db_exist_sql(db)
@@ -211,6 +501,23 @@ class ABCDatabase:
         result = self.cursor.fetchone()
         return result["COUNT(*)"] == 1
 
+    def index_exist(self, table, fields):
+        if not isinstance(fields, list):
+            fields = [fields]
+        sql = self._index_exist_sql(table, self._index_name(table, fields))
+        self.execute(sql)
+        result = self.cursor.fetchone()
+        return result["COUNT(*)"] > 0
+
+    def create_index(self, table, fields, unique=False):
+        if not isinstance(fields, list):
+            fields = [fields]
+        if self.index_exist(table, fields):
+            raise DatabaseWarning(f"Index on {table} {fields} already \
+                                  exists.")
+        sql = self._create_index_sql(table, fields, unique)
+        self.execute(sql)
+
     def add_one(self, table, fields):
         sql = self._dict_to_insert_sql(table, fields)
         return self.execute(sql, fields)
@@ -218,52 +525,241 @@ class ABCDatabase:
     def add(self, table, fields):
         return self.add_one(table, fields)
 
+    def add_ignore(self, table, fields):
+        # Insert unless a row with the same unique index value exists.
+        sql = self._dict_to_insert_ignore_sql(table, fields)
+        return self.execute(sql, fields)
+
     def add_many(self, table, fields):
         if not isinstance(fields, list):
             raise TypeError("List requied.")
         sql = self._list_to_insert_many_sql(table, fields)
         return self.executemany(sql, fields)
 
+    def add_many_ignore(self, table, fields):
+        if not isinstance(fields, list):
+            raise TypeError("List requied.")
+        if not fields:
+            return None
+        sql = self._dict_to_insert_ignore_sql(table, fields[0])
+        return self.executemany(sql, fields)
+
+    def _query(self, sql, args={}):
+        self.execute(sql, args)
+        return self.cursor.fetchall()
+
     def _find(self, table, fields, orderby=None, asc=True,
-              limit=None, offset=0):
+              limit=None, offset=0, columns=None):
         sql = self._dict_to_find_sql(table, fields, orderby, asc,
-                                     limit, offset)
-        self.execute(sql)
-        if limit == 1:
-            return self.cursor.fetchone()
-        else:
-            return self.cursor.fetchall()
+                                     limit, offset,
+                                     self._columns_sql(columns))
+        return self._query(sql, self._where_args(fields))
 
     def find_one(self, table, fields={}, orderby=None, asc=True,
                  offset=0):
-        return self._find(table, fields, orderby, asc, limit=1,
-                          offset=offset)
+        results = self._find(table, fields, orderby, asc, limit=1,
+                             offset=offset)
+        return results[0] if results else None
 
     def find_many(self, table, fields={}, orderby=None, asc=True,
-                  limit=None, offset=0):
+                  limit=None, offset=0, columns=None):
+        # `columns` limits the fetched columns, all by default.
         return self._find(table, fields, orderby, asc,
-                          limit=limit, offset=offset)
+                          limit=limit, offset=offset, columns=columns)
+
+    def pop_many(self, table, fields={}, orderby=None, asc=True, limit=1):
+        # Claim and delete up to `limit` rows in one transaction. SKIP
+        # LOCKED (MySQL 8) lets concurrent consumers claim other rows
+        # instead of waiting on the locked ones.
+        sql = self._dict_to_find_sql(table, fields, orderby, asc,
+                                     limit) + self.lock_clause
+        with self.transaction():
+            self.cursor.execute(sql, self._where_args(fields))
+            results = list(self.cursor.fetchall())
+            if results:
+                ids = [result[self.ID] for result in results]
+                self.cursor.execute(self._ids_to_delete_sql(table, ids),
+                                    self._in_args(ids))
+        return results
+
+    def claim_one(self, table, fields, update, orderby=None, asc=True):
+        # Atomically pick the first matching row, apply `update` to it
+        # and return the claimed row.
+        sql = self._dict_to_find_sql(table, fields, orderby, asc,
+                                     1) + self.lock_clause
+        with self.transaction():
+            self.cursor.execute(sql, self._where_args(fields))
+            result = self.cursor.fetchone()
+            if result:
+                where = {self.ID: result[self.ID]}
+                self.cursor.execute(
+                    self._dict_to_update_sql(table, update, where),
+                    self._update_args(update, where))
+        return result
+
+    def pop_one(self, table, fields={}, orderby=None, asc=True):
+        results = self.pop_many(table, fields, orderby, asc, limit=1)
+        return results[0] if results else None
+
+    def find_iter(self, table, fields={}, batch_size=1000, columns=None):
+        # Keyset pagination: every batch resumes after the last primary
+        # key seen instead of skipping rows with OFFSET.
+        if not isinstance(fields, dict):
+            raise TypeError("Dict required.")
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive number.")
+        if columns and self.ID not in columns:
+            columns = [self.ID] + list(columns)
+
+        where = dict(fields)
+        while True:
+            results = self.find_many(table, where, orderby=self.ID,
+                                     limit=batch_size, columns=columns)
+            yield from results
+            if len(results) < batch_size:
+                return
+            where[self.ID] = self.gt(results[-1][self.ID])
+
+    def partition_bounds(self, table, size):
+        # Every `size`-th primary key, found by walking the primary key
+        # index only. The rows between two bounds form a partition of
+        # about `size` rows that find_range() reads independently.
+        if size < 1:
+            raise ValueError("size should be a positive number.")
+        bounds = []
+        where = {}
+        while True:
+            results = self.find_many(table, where, orderby=self.ID,
+                                     limit=1, offset=size - 1,
+                                     columns=[self.ID])
+            if not results:
+                return bounds
+            bounds.append(results[0][self.ID])
+            where = {self.ID: self.gt(bounds[-1])}
+
+    def find_range(self, table, low=None, high=None, batch_size=1000,
+                   columns=None):
+        # Rows with low < primary key <= high, a None bound is open.
+        # Keyset pagination like find_iter(), stopping at `high` without
+        # reading into the next range.
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive number.")
+        if columns and self.ID not in columns:
+            columns = [self.ID] + list(columns)
+        where = {} if low is None else {self.ID: self.gt(low)}
+        while True:
+            results = self.find_many(table, where, orderby=self.ID,
+                                     limit=batch_size, columns=columns)
+            for result in results:
+                if high is not None and result[self.ID] > high:
+                    return
+                yield result
+            if len(results) < batch_size or \
+                    (high is not None and results[-1][self.ID] >= high):
+                return
+            where = {self.ID: self.gt(results[-1][self.ID])}
+
+    def upsert_many(self, table, fields, keys):
+        if not isinstance(fields, list):
+            raise TypeError("List requied.")
+        if not fields:
+            return None
+        if not isinstance(keys, list):
+            keys = [keys]
+        sql = self._dict_to_upsert_sql(table, fields[0], keys)
+        return self.executemany(sql, fields)
+
+    def upsert(self, table, fields, keys):
+        # Insert, or overwrite the row sharing the unique `keys`, in a
+        # single statement. `keys` must be covered by a unique index.
+        if not isinstance(keys, list):
+            keys = [keys]
+        sql = self._dict_to_upsert_sql(table, fields, keys)
+        return self.execute(sql, fields)
 
     def update(self, table, update, where):
         sql = self._dict_to_update_sql(table, update, where)
-        return self.execute(sql)
+        return self.execute(sql, self._update_args(update, where))
 
     def remove(self, table, fields={}):
         sql = self._dict_to_delete_sql(table, fields)
-        return self.execute(sql)
+        return self.execute(sql, self._where_args(fields or {}))
+
+    def remove_duplicates(self, table, field):
+        # Keep only the newest row (highest primary key) per `field`. The
+        # derived table lets MySQL read the table it deletes from.
+        return self.execute(f"DELETE FROM {table} WHERE {self.ID} NOT IN \
+            (SELECT keep FROM (SELECT MAX({self.ID}) AS keep FROM {table} \
+            GROUP BY {field}) AS newest)")
+
+    def remove_by_ids(self, table, ids):
+        return self.remove_in(table, self.ID, ids)
+
+    def remove_in(self, table, field, values):
+        # Delete the rows whose `field` is one of `values`.
+        if not isinstance(values, list):
+            raise TypeError("List requied.")
+        if not values:
+            return None
+        sql = self._in_delete_sql(table, field, len(values))
+        return self.execute(sql, self._in_args(values))
+
+    # Semi-joins between two tables on `field`, run inside the database.
+    # With negate, rows whose `field` is NOT found in `other` are used.
+
+    def _semi_join_sql(self, other, field, negate=False):
+        return f"{field} {'NOT IN' if negate else 'IN'} \
+            (SELECT {field} FROM {other})"
+
+    def copy_rows(self, table, target, columns, other=None, field=None,
+                  negate=False):
+        # INSERT ... SELECT; rows clashing with a unique index of
+        # `target` are skipped.
+        column_str = ", ".join(columns)
+        where_str = ""
+        if other is not None:
+            where_str = " WHERE " + self._semi_join_sql(other, field, negate)
+        return self.execute(f"{self.insert_ignore} INTO {target} \
+            ({column_str}) SELECT {column_str} FROM {table}{where_str}")
+
+    def remove_join(self, table, other, field, negate=False):
+        return self.execute(f"DELETE FROM {table} WHERE \
+            {self._semi_join_sql(other, field, negate)}")
+
+    def count_join(self, table, other, field, negate=False):
+        result = self._query(f"SELECT COUNT(*) FROM {table} WHERE \
+            {self._semi_join_sql(other, field, negate)}")[0]
+        return result["COUNT(*)"]
+
+    def find_iter_join(self, table, other, field, negate=False,
+                       batch_size=1000):
+        # Keyset pagination like find_iter().
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive number.")
+        sql = f"SELECT {self._columns_sql()} FROM {table} WHERE \
+            {self.ID} > {self._placeholder('w_last')} AND \
+            {self._semi_join_sql(other, field, negate)} \
+            ORDER BY {self.ID} LIMIT {batch_size}"
+        last = 0
+        while True:
+            results = self._query(sql, {"w_last": last})
+            yield from results
+            if len(results) < batch_size:
+                return
+            last = results[-1][self.ID]
 
     def count(self, table, fields={}):
         sql = self._count_sql(table, fields)
-        self.execute(sql)
-        result = self.cursor.fetchone()
+        result = self._query(sql, self._where_args(fields))[0]
         return result["COUNT(*)"]
 
     def add_update(self, table, fields, where=None):
         where = where or fields
         result = self.find_one(table, where)
         if not result:
-            if self.ID in fields:
-                del fields[self.ID]
+            for key in (self.ID,) + self.ID_ALIASES:
+                if key in fields:
+                    del fields[key]
             self.add_one(table, fields)
         else:
             if result != fields:
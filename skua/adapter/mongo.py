@@ -1,4 +1,5 @@
 import pymongo
+from contextlib import contextmanager
 from urllib.parse import quote_plus
 from .database import (ABCDatabase,
                        DatabaseError,
@@ -8,6 +9,10 @@ from .database import (ABCDatabase,
 class MongoDB(ABCDatabase):
     ID = "_id"
 
+    @staticmethod
+    def eq(value):
+        return {"$eq": value}
+
     @staticmethod
     def gt(value):
         return {"$gt": value}
@@ -51,6 +56,15 @@ class MongoDB(ABCDatabase):
     def _reconnect(self):
         self._conn = pymongo.MongoClient(self._uri)
 
+    @property
+    def thread_safe(self):
+        # MongoClient is thread-safe and pools its own connections.
+        return True
+
+    @property
+    def concurrent_reads(self):
+        return True
+
     @property
     def is_open(self):
         if not self._conn:
@@ -71,6 +85,13 @@ class MongoDB(ABCDatabase):
     def close(self):
         self.conn.close()
 
+    @contextmanager
+    def transaction(self, immediate=False):
+        # Every write is applied on its own; multi-document transactions
+        # need a replica set and a session passed to every call. pop and
+        # claim are single atomic find_one_and_* commands already.
+        yield self
+
     def select_db(self, db):
         self._db = self.conn.get_database(db)
 
@@ -89,46 +110,206 @@ class MongoDB(ABCDatabase):
         return table in self.db.collection_names(
                 include_system_collections=False)
 
+    def index_exist(self, table, fields):
+        if not isinstance(fields, list):
+            fields = [fields]
+        index = self._index_name(table, fields)
+        return index in self.db[table].index_information()
+
+    def create_index(self, table, fields, unique=False):
+        # create_index is idempotent in MongoDB, no warning is raised.
+        if not isinstance(fields, list):
+            fields = [fields]
+        keys = [(field, pymongo.ASCENDING) for field in fields]
+        return self.db[table].create_index(
+            keys, unique=unique, name=self._index_name(table, fields))
+
+    def upsert(self, table, fields, keys):
+        if not isinstance(fields, dict):
+            raise TypeError("Dict requied.")
+        if not isinstance(keys, list):
+            keys = [keys]
+        where = {key: fields[key] for key in keys}
+        return self.db[table].update_one(where, {"$set": fields},
+                                         upsert=True)
+
+    def upsert_many(self, table, fields, keys):
+        if not isinstance(fields, list):
+            raise TypeError("List requied.")
+        if not fields:
+            return None
+        if not isinstance(keys, list):
+            keys = [keys]
+        requests = [pymongo.UpdateOne({key: row[key] for key in keys},
+                                      {"$set": row}, upsert=True)
+                    for row in fields]
+        return self.db[table].bulk_write(requests)
+
     def add_one(self, table, fields={}):
         if not isinstance(fields, dict):
             raise TypeError("Dict requied.")
         return self.db[table].insert_one(fields)
 
+    def add_ignore(self, table, fields={}):
+        if not isinstance(fields, dict):
+            raise TypeError("Dict requied.")
+        try:
+            return self.db[table].insert_one(fields)
+        except pymongo.errors.DuplicateKeyError:
+            return None
+
     def add_many(self, table, fields={}):
         if not isinstance(fields, list):
             raise TypeError("List requied.")
         return self.db[table].insert_many(fields)
 
+    def add_many_ignore(self, table, fields={}):
+        if not isinstance(fields, list):
+            raise TypeError("List requied.")
+        if not fields:
+            return None
+        try:
+            return self.db[table].insert_many(fields, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # Only duplicate key errors (11000) are expected here.
+            if any(error["code"] != 11000
+                   for error in e.details["writeErrors"]):
+                raise
+            return None
+
+    @staticmethod
+    def _sort(orderby, asc=True):
+        if not isinstance(orderby, list):
+            orderby = [orderby]
+        order = pymongo.ASCENDING if asc else pymongo.DESCENDING
+        return [(name, order) for name in orderby]
+
     def find_one(self, table, fields={}, orderby=None, asc=True, offset=0):
         if not isinstance(fields, dict):
             raise TypeError("Dict requied.")
         if orderby:
-            order = pymongo.ASCENDING if asc else pymongo.DESCENDING
-            result = self.db[table].find_one(fields, sort=[(orderby, order)],
+            result = self.db[table].find_one(fields,
+                                             sort=self._sort(orderby, asc),
                                              skip=offset)
         else:
             result = self.db[table].find_one(fields, skip=offset)
         return result
 
     def find_many(self, table, fields={}, orderby=None, asc=True,
-                  limit=0, offset=0):
+                  limit=0, offset=0, columns=None):
+        cursor = self.db[table].find(fields, projection=columns)
         if orderby:
-            order = pymongo.ASCENDING if asc else pymongo.DESCENDING
-            result = self.db[table].find(fields).sort(orderby, order)\
+            result = cursor.sort(self._sort(orderby, asc))\
                 .skip(offset).limit(limit)
         else:
-            result = self.db[table].find(fields).skip(offset).limit(limit)
+            result = cursor.skip(offset).limit(limit)
         return list(result)
 
+    def pop_one(self, table, fields={}, orderby=None, asc=True):
+        if not isinstance(fields, dict):
+            raise TypeError("Dict requied.")
+        sort = self._sort(orderby, asc) if orderby else None
+        return self.db[table].find_one_and_delete(fields, sort=sort)
+
+    def claim_one(self, table, fields, update, orderby=None, asc=True):
+        if not isinstance(fields, dict):
+            raise TypeError("Dict requied.")
+        sort = self._sort(orderby, asc) if orderby else None
+        return self.db[table].find_one_and_update(fields, {"$set": update},
+                                                  sort=sort)
+
+    def pop_many(self, table, fields={}, orderby=None, asc=True, limit=1):
+        # Every find_one_and_delete is atomic on its own, so concurrent
+        # consumers never receive the same document.
+        results = []
+        while len(results) < limit:
+            result = self.pop_one(table, fields, orderby, asc)
+            if result is None:
+                break
+            results.append(result)
+        return results
+
     def update(self, table, update={}, where={}):
         return self.db[table].update_many(where, {"$set": update})
 
     def remove(self, table, fields={}):
         return self.db[table].delete_many(fields)
 
+    def remove_duplicates(self, table, field, batch=1000):
+        # ObjectIds grow with insertion time, keep the highest per value.
+        groups = self.db[table].aggregate([
+            {"$group": {"_id": f"${field}", "ids": {"$push": "$_id"},
+                        "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}], allowDiskUse=True)
+        ids = []
+        for group in groups:
+            ids.extend(sorted(group["ids"])[:-1])
+            if len(ids) >= batch:
+                self.remove_by_ids(table, ids)
+                ids = []
+        if ids:
+            self.remove_by_ids(table, ids)
+
+    def remove_by_ids(self, table, ids):
+        return self.remove_in(table, self.ID, ids)
+
+    def remove_in(self, table, field, values):
+        if not isinstance(values, list):
+            raise TypeError("List requied.")
+        return self.db[table].delete_many({field: {"$in": values}})
+
     def count(self, table, fields):
         return self.db[table].find(fields).count()
 
+    def _semi_join(self, other, field, negate=False):
+        # $lookup the matching documents of `other`, keep the documents
+        # with (or, with negate, without) a match.
+        return [{"$lookup": {"from": other,
+                             "localField": field,
+                             "foreignField": field,
+                             "as": "_matches"}},
+                {"$match": {"_matches": {"$size": 0} if negate
+                            else {"$ne": []}}}]
+
+    def copy_rows(self, table, target, columns, other=None, field=None,
+                  negate=False):
+        # $merge on the unique key column skips existing documents.
+        pipeline = []
+        if other is not None:
+            pipeline += self._semi_join(other, field, negate)
+        projection = {column: 1 for column in columns}
+        projection[self.ID] = 0
+        pipeline += [{"$project": projection},
+                     {"$merge": {"into": target,
+                                 "on": field or columns[0],
+                                 "whenMatched": "keepExisting",
+                                 "whenNotMatched": "insert"}}]
+        self.db[table].aggregate(pipeline)
+
+    def remove_join(self, table, other, field, negate=False, batch=1000):
+        pipeline = self._semi_join(other, field, negate) + \
+            [{"$project": {self.ID: 1}}]
+        ids = []
+        for doc in self.db[table].aggregate(pipeline):
+            ids.append(doc[self.ID])
+            if len(ids) >= batch:
+                self.remove_by_ids(table, ids)
+                ids = []
+        if ids:
+            self.remove_by_ids(table, ids)
+
+    def count_join(self, table, other, field, negate=False):
+        pipeline = self._semi_join(other, field, negate) + \
+            [{"$count": "count"}]
+        result = list(self.db[table].aggregate(pipeline))
+        return result[0]["count"] if result else 0
+
+    def find_iter_join(self, table, other, field, negate=False,
+                       batch_size=1000):
+        pipeline = self._semi_join(other, field, negate) + \
+            [{"$project": {"_matches": 0}}]
+        yield from self.db[table].aggregate(pipeline, batchSize=batch_size)
+
     def add_update(self, table, fields, where=None):
         where = where or fields
         if self.ID in fields:
@@ -6,8 +6,8 @@ class MySQLDB(ABCDatabase):
     blob = "BLOB"
     ID = "id"
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
 
     def connect(self, host=None, port=None, user=None, passwd=None, db=None,
                 charset=None, cursorclass=None):
@@ -22,11 +22,14 @@ class MySQLDB(ABCDatabase):
         self._db = db
         self._charset = charset or "utf8"
         self._cursorclass = cursorclass
-        self._reconnect()
+        if self.pooled:
+            self._start_pool()
+        else:
+            self._reconnect()
         self._connected = True
 
-    def _reconnect(self):
-        self._conn = pymysql.connect(
+    def _new_connection(self):
+        conn = pymysql.connect(
             host=self._host,
             port=self._port,
             user=self._user,
@@ -35,17 +38,33 @@ class MySQLDB(ABCDatabase):
             cursorclass=self._cursorclass or pymysql.cursors.DictCursor,
             db=self._db)
 
-        if not self._conn.open:
+        if not conn.open:
             raise DatabaseError(f"Connect to {self._user}@{self._host}:\
                                 {self._port} failed.")
+        return conn
+
+    def _conn_open(self, conn):
+        return conn.open
 
     def close(self):
-        self.cursor.close()
-        self.conn.close()
+        # Containers sharing an adapter all close it, only the first
+        # close does anything.
+        if not self._connected:
+            return
+        self.flush()
+        if self._pool is not None:
+            self._close_pool()
+        else:
+            self.cursor.close()
+            self.conn.close()
+            self._conn = self._cursor = None
+        self._connected = False
 
     @property
     def is_open(self):
-        return self._conn.open
+        if self._pool is not None:
+            return not self._pool.closed
+        return self._conn is not None and self._conn.open
 
     def _table_exist_sql(self, table):
         return f"SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES WHERE \
@@ -55,6 +74,16 @@ class MySQLDB(ABCDatabase):
         return f"SELECT COUNT(*) FROM INFORMATION_SCHEMA.SCHEMATA WHERE \
             SCHEMA_NAME='{db}'"
 
+    def _index_exist_sql(self, table, index):
+        return f"SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS WHERE \
+            TABLE_SCHEMA=DATABASE() AND TABLE_NAME='{table}' AND \
+            INDEX_NAME='{index}'"
+
+    def _placeholder(self, key, value=None):
+        if isinstance(value, bytes):
+            return f"_binary %({key})s"
+        return f"%({key})s"
+
     def _dict_to_insert_binary_sql(self, table, fields):
         if not isinstance(fields, dict):
             raise TypeError("Dict required.")
@@ -87,7 +116,11 @@ class MySQLDB(ABCDatabase):
     def select_db(self, db, create=True):
         if not self.db_exist(db) and create:
             self.create_db(db)
+        self._db = db
         self.conn.select_db(db)
+        if self._pool is not None:
+            # Idle connections still use the old database.
+            self._pool.drain()
 
     def create_db(self, db):
         sql = self._create_db_sql(db)
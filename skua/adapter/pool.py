@@ -0,0 +1,156 @@
+import threading
+from collections import deque
+from time import time
+
+
+class PoolError(Exception):
+    pass
+
+
+class ConnectionPool:
+    # A bounded pool of DB-API connections. `factory` opens a new
+    # connection, `is_open` is the health check run before a pooled
+    # connection is handed out again, and `close` closes one.
+    def __init__(self, factory, max_size, min_size=0, is_open=None,
+                 close=None, idle_timeout=None, timeout=None):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Pool sizes should satisfy \
+                             0 <= min_size <= max_size, 1 <= max_size.")
+        self.max_size = max_size
+        self.min_size = min_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.closed = False
+        self._factory = factory
+        self._is_open = is_open or (lambda conn: True)
+        self._close = close or (lambda conn: conn.close())
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def fill(self):
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            self.release(self._open())
+
+    def _open(self):
+        try:
+            return self._factory()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _discard(self, conn):
+        # Must be called with the condition held.
+        self._size -= 1
+        try:
+            self._close(conn)
+        except Exception:
+            pass
+
+    def _evict_idle(self):
+        # Must be called with the condition held. The oldest idle
+        # connections sit at the left end of the deque.
+        if self.idle_timeout is None:
+            return
+        expired = time() - self.idle_timeout
+        while self._idle and self._size > self.min_size and \
+                self._idle[0][1] < expired:
+            conn, _ = self._idle.popleft()
+            self._discard(conn)
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        endtime = None if timeout is None else time() + timeout
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise PoolError("Connection pool closed.")
+                self._evict_idle()
+                while self._idle:
+                    # Most recently used first, its server side state is
+                    # most likely to be warm.
+                    conn, _ = self._idle.pop()
+                    if self._is_open(conn):
+                        return conn
+                    self._discard(conn)
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if endtime is None:
+                    self._cond.wait()
+                else:
+                    remaining = endtime - time()
+                    if remaining <= 0.0:
+                        raise PoolError("No connection available in pool.")
+                    self._cond.wait(remaining)
+        return self._open()
+
+    def release(self, conn):
+        with self._cond:
+            if self.closed or not self._is_open(conn):
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time()))
+                self._evict_idle()
+            self._cond.notify()
+
+    def drain(self):
+        # Close the idle connections, e.g. after a setting that only new
+        # connections pick up has changed.
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+
+class Checkout:
+    # A connection bound to one thread. It is stored in a threading.local,
+    # so it goes back to the pool when the thread exits.
+    def __init__(self, pool):
+        self._pool = pool
+        self.conn = pool.acquire()
+        self._cursor = None
+
+    @property
+    def cursor(self):
+        if self._cursor is None:
+            self._cursor = self.conn.cursor()
+        return self._cursor
+
+    def release(self):
+        if self.conn is None:
+            return
+        if self._cursor is not None:
+            try:
+                self._cursor.close()
+            except Exception:
+                pass
+            self._cursor = None
+        conn, self.conn = self.conn, None
+        self._pool.release(conn)
+
+    def __del__(self):
+        self.release()
@@ -1,8 +1,11 @@
 import sqlite3
 import threading
+from contextlib import nullcontext
+from functools import partial
 from .database import (ABCDatabase,
                        DatabaseError,
                        DatabaseWarning)
+from .pool import ConnectionPool
 
 
 def results_gen(results):
@@ -12,25 +15,89 @@ def results_gen(results):
 
 class SQLiteDB(ABCDatabase):
     blob = "BLOB"
-    ID = "id"
+    insert_ignore = "INSERT OR IGNORE"
+    # Paging and claiming go through the rowid. Tables created by skua
+    # alias it as `id`, older ones only have the implicit rowid.
+    ID = "rowid"
+    ID_ALIASES = ("id",)
+    # Pragmas applied to every new connection by connect(profile=...).
+    # WAL lets readers run while a write is in progress, and NORMAL
+    # synchronous only fsyncs the WAL at checkpoints.
+    PROFILES = {
+        "performance": {"journal_mode": "WAL",
+                        "synchronous": "NORMAL",
+                        "mmap_size": 256 * 1024 * 1024,
+                        "cache_size": -64 * 1024,
+                        "temp_store": "MEMORY"}}
+    PRAGMAS = ("journal_mode", "synchronous", "mmap_size", "cache_size",
+               "temp_store", "busy_timeout", "wal_autocheckpoint")
 
-    def __init__(self):
-        super().__init__()
-        self.mutex = threading.Lock()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.mutex = threading.RLock()
+        self._pragmas = {}
+        self._readers = None
+
+    @property
+    def lock(self):
+        # A shared connection must be used by one thread at a time; pooled
+        # connections belong to a single thread and need no lock.
+        return nullcontext() if self._pool is not None else self.mutex
+
+    @property
+    def thread_safe(self):
+        # The shared connection is only used under the mutex.
+        return True
+
+    @property
+    def concurrent_reads(self):
+        return self.pooled or self._readers is not None
 
     def close(self):
-        self.cursor.close()
-        self.conn.close()
+        # Containers sharing an adapter all close it, only the first
+        # close does anything.
+        if not self._connected:
+            return
+        self.flush()
+        if self._readers is not None:
+            self._readers.close()
+        if self._pool is not None:
+            self._close_pool()
+        else:
+            self.cursor.close()
+            self.conn.close()
+            self._conn = self._cursor = None
+        self._connected = False
 
-    def connect(self, database=None, timeout=5):
+    def connect(self, database=None, timeout=5, profile=None, readers=0,
+                **pragmas):
+        # `readers` opens a separate pool of read-only connections for
+        # SELECTs, so lookups do not queue behind writes. Combine it with
+        # WAL, where readers and the writer do not block each other.
         if self._connected:
             raise DatabaseError("Can not connect twice to a database \
                                 in a instance.")
+        if profile is not None and profile not in self.PROFILES:
+            raise ValueError(f"Unknown profile {profile}.")
+        for name in pragmas:
+            if name not in self.PRAGMAS:
+                raise ValueError(f"Unknown pragma {name}.")
+
         self._database = database or ":memory:"
         self._timeout = timeout
+        self._pragmas = dict(self.PROFILES.get(profile, {}), **pragmas)
+        if self._database == ":memory:" and (self.pooled or readers):
+            raise DatabaseError("An in-memory database can not be \
+                                shared by several connections.")
+        if self.pooled:
+            self._start_pool()
+        if readers:
+            self._readers = ConnectionPool(
+                partial(self._new_connection, readonly=True),
+                max_size=readers)
         self._connected = True
 
-    def _reconnect(self):
+    def _new_connection(self, readonly=False):
         # Using SQLite In Multi-Threaded Applications
         # Serialized. In serialized mode, SQLite can be safely used by
         # multiple threads with no restriction.
@@ -43,23 +110,40 @@ class SQLiteDB(ABCDatabase):
         # should be serialized by the user to avoid data corruption.
         # https://docs.python.org/3/library/sqlite3.html#sqlite3.connect
 
-        self._conn = sqlite3.connect(
+        # The statement texts are stable, so sqlite3's own statement
+        # cache keeps them compiled.
+        conn = sqlite3.connect(
             database=self._database,
             timeout=self._timeout,
-            check_same_thread=False)
-        self._conn.row_factory = sqlite3.Row
+            check_same_thread=False,
+            cached_statements=self.SQL_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for name, value in self._pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
 
     @property
     def is_open(self):
         return True
 
     def _table_to_sql(self, table, fields):
-        field_str = ""
+        # INTEGER PRIMARY KEY aliases the rowid, so it costs nothing.
+        field_str = "id INTEGER PRIMARY KEY,"
         for key, value in fields.items():
             field_str += f"{key} {value},"
         field_str = field_str[:-1]
         return f"CREATE  TABLE {table} ({field_str})"
 
+    def _columns_sql(self, columns=None):
+        # SELECT * leaves out the implicit rowid, and on an aliased one
+        # reports it as `id`, so name it explicitly.
+        if not columns:
+            return f"{self.ID} AS {self.ID}, *"
+        return ", ".join(f"{self.ID} AS {self.ID}" if column == self.ID
+                         else column for column in columns)
+
     def select_db(self, *args, **kwarsg):
         raise DatabaseWarning(f"Command 'select db' not suport \
                               in {self.__class__.__name__}.")
@@ -72,55 +156,124 @@ class SQLiteDB(ABCDatabase):
         return f"SELECT COUNT(*) FROM sqlite_master WHERE type='table' \
                AND name='{table}'"
 
-    def _list_to_insert_many_sql(self, table, fields):
-        if not isinstance(fields, list):
-            raise TypeError("List required.")
-
-        key_str = ""
-        value_str = ""
-        for key in fields[0].keys():
-            key_str += f"{key},"
-            value_str += f":{key},"
+    def _index_exist_sql(self, table, index):
+        return f"SELECT COUNT(*) FROM sqlite_master WHERE type='index' \
+               AND tbl_name='{table}' AND name='{index}'"
 
-        return f"INSERT INTO {table} ({key_str[:-1]}) VALUES \
-               ({value_str[:-1]})"
+    def _create_index_sql(self, table, fields, unique=False):
+        # Every index entry already ends with the rowid, which can not be
+        # listed as an index column.
+        index = self._index_name(table, fields)
+        unique_str = "UNIQUE " if unique else ""
+        columns = [field for field in fields if field != self.ID]
+        return f"CREATE {unique_str}INDEX {index} ON {table} \
+            ({', '.join(columns)})"
 
-    def _dict_to_insert_sql(self, table, fields):
-        if not isinstance(fields, dict):
-            raise TypeError("Dict required.")
+    def _placeholder(self, key, value=None):
+        return f":{key}"
 
-        key_str = ""
-        value_str = ""
-        for key in fields.keys():
-            key_str += f"{key},"
-            value_str += f":{key},"
+    def _build_upsert_sql(self, table, columns, keys):
+        key_str = ",".join(key for key, _ in columns)
+        update_str = ",".join(f"{key}=excluded.{key}"
+                              for key, _ in columns if key not in keys)
+        if update_str:
+            conflict_str = f"DO UPDATE SET {update_str}"
+        else:
+            conflict_str = "DO NOTHING"
 
-        return f"INSERT INTO {table} ({key_str[:-1]}) VALUES \
-               ({value_str[:-1]})"
+        return f"INSERT INTO {table} ({key_str}) VALUES \
+               ({self._values_sql(columns)}) \
+               ON CONFLICT ({','.join(keys)}) {conflict_str}"
 
     def execute(self, sql, args={}):
-        with self.mutex:
+        with self.lock, self._pending().lock:
             rows = self.cursor.execute(sql, args)
-            self.conn.commit()
+            self._commit()
             return rows
 
     def executemany(self, sql, args):
-        with self.mutex:
+        with self.lock, self._pending().lock:
             rows = self.cursor.executemany(sql, args)
-            self.conn.commit()
+            self._commit()
             return rows
 
-    def _find(self, table, fields, orderby=None, asc=True,
-              limit=None, offset=0):
-        sql = self._dict_to_find_sql(table, fields, orderby, asc,
-                                     limit, offset)
-        self.execute(sql)
-        if limit == 1:
-            result = self.cursor.fetchone()
-            return dict(result) if result else None
+    def _transaction_lock(self):
+        # A shared connection is held for the whole transaction, so other
+        # threads can not slip statements into it.
+        return self.lock
+
+    def _begin(self, immediate=False):
+        # Statements left over by group commit join the transaction.
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+    def flush(self):
+        with self.lock:
+            super().flush()
+
+    def _query(self, sql, args={}):
+        # Uncommitted writes are only visible on the writer connection.
+        if self._readers is not None and not self.in_transaction and \
+                not self._pending().count:
+            conn = self._readers.acquire()
+            try:
+                results = conn.execute(sql, args).fetchall()
+            finally:
+                self._readers.release(conn)
         else:
-            results = self.cursor.fetchall()
-            return list(results_gen(results)) if results else []
+            with self.lock, self._pending().lock:
+                results = self.cursor.execute(sql, args).fetchall()
+        return list(results_gen(results))
+
+    def pop_many(self, table, fields={}, orderby=None, asc=True, limit=1):
+        # A single DELETE ... RETURNING is atomic. Older SQLite falls back
+        # to select + delete inside a BEGIN IMMEDIATE transaction.
+        select_sql = self._dict_to_find_sql(table, fields, orderby, asc,
+                                            limit, columns=self.ID)
+        args = self._where_args(fields)
+        columns = self._columns_sql()
+        with self.transaction(immediate=True):
+            if sqlite3.sqlite_version_info >= (3, 35, 0):
+                self.cursor.execute(f"DELETE FROM {table} WHERE \
+                    {self.ID} IN ({select_sql}) RETURNING {columns}", args)
+                results = list(results_gen(self.cursor.fetchall()))
+            else:
+                self.cursor.execute(f"SELECT {columns} FROM {table} WHERE \
+                    {self.ID} IN ({select_sql})", args)
+                results = list(results_gen(self.cursor.fetchall()))
+                self.cursor.execute(f"DELETE FROM {table} WHERE \
+                    {self.ID} IN ({select_sql})", args)
+
+        # RETURNING does not promise any row order.
+        if orderby:
+            if not isinstance(orderby, list):
+                orderby = [orderby]
+            results.sort(key=lambda result: [result[name] for name in orderby],
+                         reverse=not asc)
+        return results
+
+    def claim_one(self, table, fields, update, orderby=None, asc=True):
+        select_sql = self._dict_to_find_sql(table, fields, orderby, asc,
+                                            1, columns=self.ID)
+        update_str = ",".join(f"{key}={self._placeholder(f's_{key}')}"
+                              for key in update.keys())
+        args = self._update_args(update, fields)
+        columns = self._columns_sql()
+        with self.transaction(immediate=True):
+            if sqlite3.sqlite_version_info >= (3, 35, 0):
+                self.cursor.execute(f"UPDATE {table} SET {update_str} \
+                    WHERE {self.ID} IN ({select_sql}) \
+                    RETURNING {columns}", args)
+                result = self.cursor.fetchone()
+            else:
+                self.cursor.execute(f"SELECT {columns} FROM {table} WHERE \
+                    {self.ID} IN ({select_sql})", args)
+                result = self.cursor.fetchone()
+                if result:
+                    self.cursor.execute(f"UPDATE {table} SET \
+                        {update_str} WHERE {self.ID}={result[self.ID]}",
+                                        args)
+        return dict(result) if result else None
 
     def add_one(self, table, fields):
         sql = self._dict_to_insert_sql(table, fields)
@@ -0,0 +1,273 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from queue import Empty, Full
+from random import uniform
+from .bigdict import BigDict
+from .bigqueue import BigQueue, BigPriorityQueue
+from .bigset import BigSet
+
+
+class AsyncContainer:
+    # The adapters are blocking, so every database call runs on a
+    # single worker thread owned by the container. One thread keeps the
+    # adapter connection used serially, which pymysql and pymongo
+    # cursors need, while the event loop stays free. Only the
+    # constructor, which creates the table, runs in the caller's thread.
+    container_class = None
+
+    def __init__(self, *args, **kwargs):
+        self._container = self.container_class(*args, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          partial(func, *args, **kwargs))
+
+    async def _iter(self, gen, batch_size):
+        # Hop to the worker thread once per batch, not once per item.
+        while True:
+            batch = await self._run(lambda: list(islice(gen, batch_size)))
+            if not batch:
+                return
+            for item in batch:
+                yield item
+
+    async def len(self):
+        return await self._run(self._container.__len__)
+
+    async def clear(self):
+        return await self._run(self._container.clear)
+
+    async def delete(self):
+        return await self._run(self._container.delete)
+
+    async def flush(self):
+        return await self._run(self._container.flush)
+
+    def close(self):
+        # Close the container on the worker, which writes out its
+        # write-behind buffer and Bloom filter, before it goes away.
+        closed = self._executor.submit(self._container.close)
+        self._executor.shutdown(wait=True)
+        closed.result()
+
+
+class AsyncBigDict(AsyncContainer):
+    container_class = BigDict
+
+    async def getitem(self, key):
+        return await self._run(self._container.__getitem__, key)
+
+    async def setitem(self, key, value):
+        return await self._run(self._container.__setitem__, key, value)
+
+    async def delitem(self, key):
+        return await self._run(self._container.__delitem__, key)
+
+    async def contains(self, key):
+        return await self._run(self._container.__contains__, key)
+
+    async def get(self, key, default=None):
+        return await self._run(self._container.get, key, default)
+
+    async def pop(self, key):
+        return await self._run(self._container.pop, key)
+
+    async def popitem(self):
+        return await self._run(self._container.popitem)
+
+    async def update(self, dic, chunk_size=None):
+        return await self._run(self._container.update, dic, chunk_size)
+
+    def items(self, batch_size=None):
+        batch_size = batch_size or self._container.BATCH_SIZE
+        return self._iter(self._container.items(batch_size), batch_size)
+
+    async def keys(self, batch_size=None):
+        async for key, _ in self.items(batch_size):
+            yield key
+
+    async def values(self, batch_size=None):
+        async for _, value in self.items(batch_size):
+            yield value
+
+    def __aiter__(self):
+        return self.keys()
+
+
+class AsyncBigSet(AsyncContainer):
+    container_class = BigSet
+
+    async def add(self, obj):
+        return await self._run(self._container.add, obj)
+
+    async def update(self, it, chunk_size=None):
+        return await self._run(self._container.update, it, chunk_size)
+
+    async def remove(self, obj):
+        return await self._run(self._container.remove, obj)
+
+    async def contains(self, obj):
+        return await self._run(self._container.__contains__, obj)
+
+    async def pop(self):
+        return await self._run(self._container.pop)
+
+    def members(self, batch_size=None):
+        batch_size = batch_size or self._container.BATCH_SIZE
+        return self._iter(self._container.members(batch_size), batch_size)
+
+    def __aiter__(self):
+        return self.members()
+
+
+class AsyncBigQueue(AsyncContainer):
+    # Mirrors asyncio.Queue. Waiters park on asyncio conditions instead
+    # of threads; the queue table is only touched through non-blocking
+    # calls of the underlying BigQueue.
+    container_class = BigQueue
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._not_empty = asyncio.Condition()
+        self._not_full = asyncio.Condition()
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._poll_delay = self._container.poll_interval
+
+    async def _wait(self, condition):
+        # Shared queues are also fed by other processes, which cannot
+        # notify us, so wait with the same backoff as BigQueue.
+        queue = self._container
+        if not queue.shared:
+            await condition.wait()
+            return
+
+        delay = max(uniform(self._poll_delay / 2, self._poll_delay),
+                    queue.poll_interval)
+        try:
+            await asyncio.wait_for(condition.wait(), delay)
+            self._poll_delay = queue.poll_interval
+        except asyncio.TimeoutError:
+            self._poll_delay = min(self._poll_delay * 2, queue.poll_max)
+
+    async def _notify(self, condition, n=1):
+        async with condition:
+            condition.notify(n)
+
+    # In shared and lease mode these count rows, so like every other
+    # call they run on the worker thread.
+    async def qsize(self):
+        return await self._run(self._container.qsize)
+
+    async def empty(self):
+        return await self._run(self._container.empty)
+
+    async def full(self):
+        return await self._run(self._container.full)
+
+    @property
+    def maxsize(self):
+        return self._container.maxsize
+
+    async def get(self):
+        async with self._not_empty:
+            while True:
+                try:
+                    item = await self._run(self._container.get, False)
+                    break
+                except Empty:
+                    await self._wait(self._not_empty)
+        self._poll_delay = self._container.poll_interval
+        await self._notify(self._not_full)
+        return item
+
+    async def get_nowait(self):
+        item = await self._run(self._container.get, False)
+        await self._notify(self._not_full)
+        return item
+
+    async def get_many(self, max_items):
+        async with self._not_empty:
+            while True:
+                try:
+                    items = await self._run(self._container.get_many,
+                                            max_items, False)
+                    break
+                except Empty:
+                    await self._wait(self._not_empty)
+        self._poll_delay = self._container.poll_interval
+        await self._notify(self._not_full, len(items))
+        return items
+
+    async def put(self, obj):
+        async with self._not_full:
+            while True:
+                try:
+                    await self._run(self._container.put, obj, False)
+                    break
+                except Full:
+                    await self._wait(self._not_full)
+        self._finished.clear()
+        await self._notify(self._not_empty)
+
+    async def put_nowait(self, obj):
+        await self._run(self._container.put, obj, False)
+        self._finished.clear()
+        await self._notify(self._not_empty)
+
+    def _put_some(self, objs):
+        # Runs on the worker thread: put as many objects as there is room
+        # for and return how many.
+        queue = self._container
+        room = len(objs)
+        if queue.maxsize > 0:
+            room = min(room, max(queue.maxsize - queue.qsize(), 0))
+        if room:
+            queue.put_many(objs[:room], False)
+        return room
+
+    async def put_many(self, objs):
+        objs = list(objs)
+        while objs:
+            async with self._not_full:
+                while True:
+                    count = await self._run(self._put_some, objs)
+                    if count:
+                        break
+                    await self._wait(self._not_full)
+            objs = objs[count:]
+            self._finished.clear()
+            await self._notify(self._not_empty, count)
+
+    async def get_lease(self):
+        async with self._not_empty:
+            while True:
+                try:
+                    return await self._run(self._container.get_lease,
+                                           False)
+                except Empty:
+                    await self._wait(self._not_empty)
+
+    async def ack(self, handle):
+        return await self._run(self._container.ack, handle)
+
+    def task_done(self):
+        # Leased items must be acked with `await ack(handle)` first.
+        self._container.task_done()
+        if not self._container.unfinished_tasks:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    async def clear(self):
+        await self._run(self._container.clear)
+        await self._notify(self._not_full, self.maxsize or 1)
+
+
+class AsyncBigPriorityQueue(AsyncBigQueue):
+    container_class = BigPriorityQueue
@@ -1,13 +1,30 @@
-from .container import Container
+from contextlib import contextmanager
+from .cache import LRUCache
+from .container import Container, MapReduce, chunked
 from .adapter.database import DatabaseWarning
 
 
-class BigDict(Container):
+class BigDict(MapReduce, Container):
     KEY = "_key"
     VALUE = "_value"
-
-    def __init__(self, adapter=None, name=None):
-        super().__init__(adapter, name)
+    MAP_COLUMNS = (KEY, VALUE)
+
+    def __init__(self, adapter=None, name=None, serializer=None,
+                 compression=None, compress_threshold=1024,
+                 cache_size=None, cache_bytes=None, cache_ttl=None,
+                 write_behind=False, flush_size=1000, flush_interval=None,
+                 bloom_capacity=None, bloom_error_rate=0.01):
+        super().__init__(adapter, name, serializer, compression,
+                         compress_threshold)
+        # Optional read-through cache of decoded values, bounded by
+        # entries (cache_size) and/or stored bytes (cache_bytes). Writes
+        # through this object keep it current; writes by other processes
+        # are only picked up once an entry is older than cache_ttl.
+        # Cached values are shared between readers, do not mutate them.
+        if cache_size is None and cache_bytes is None and cache_ttl is None:
+            self._cache = None
+        else:
+            self._cache = LRUCache(cache_size, cache_bytes, cache_ttl)
         if not self._adapter.table_exit(self._table):
             try:
                 self._adapter.create_table(self._table, {
@@ -15,15 +32,52 @@ class BigDict(Container):
                     self.VALUE: self._adapter.blob})
             except DatabaseWarning:
                 pass
+        # Tables written before keys were upserted may hold several rows
+        # per key; the last one written is the current value.
+        if not self._adapter.index_exist(self._table, [self.KEY]):
+            with self.batch():
+                self._adapter.remove_duplicates(self._table, self.KEY)
+                try:
+                    self._adapter.create_index(self._table, [self.KEY],
+                                               unique=True)
+                except DatabaseWarning:
+                    pass
+        self._init_write_behind(write_behind, flush_size, flush_interval)
+        self._init_bloom(bloom_capacity, bloom_error_rate, self.KEY)
 
     def _find_one_by_key(self, key):
         return self._adapter.find_one(self._table, {self.KEY: key})
 
+    @property
+    def cache_info(self):
+        return self._cache.info() if self._cache is not None else None
+
+    def _cache_put(self, key, value, data):
+        if self._cache is not None:
+            self._cache.put(str(key), value, len(data))
+
+    def _cache_pop(self, key):
+        if self._cache is not None:
+            self._cache.pop(str(key))
+
     def __getitem__(self, key):
+        if self._cache is not None:
+            hit, value = self._cache.get(str(key))
+            if hit:
+                return value
+        pending, data = self._lookup_pending(str(key))
+        if pending:
+            if data is None:
+                raise KeyError(key)
+            return self._loads(data)
+        if self._bloom_miss(str(key)):
+            raise KeyError(key)
         result = self._find_one_by_key(key)
         if result:
-            value = result.get(self.VALUE)
-            return self._loads(value)
+            data = result.get(self.VALUE)
+            value = self._loads(data)
+            self._cache_put(key, value, data)
+            return value
         raise KeyError(key)
 
     def __setitem__(self, key, value):
@@ -32,15 +86,28 @@ class BigDict(Container):
 
         data = {self.KEY: key,
                 self.VALUE: self._dumps(value)}
-        if hasattr(self._adapter, "add_one_binary"):
-            self._adapter.add_one_binary(self._table, data)
+        self._bloom_add(key)
+        if self._pending is not None:
+            self._buffer(key, data[self.VALUE])
         else:
-            self._adapter.add_one(self._table, data)
+            self._adapter.upsert(self._table, data, [self.KEY])
+        self._cache_put(key, value, data[self.VALUE])
 
     def __delitem__(self, key):
-        self._adapter.remove(self._table, {self.KEY: key})
+        if self._pending is not None:
+            self._buffer(str(key), None)
+        else:
+            self._adapter.remove(self._table, {self.KEY: key})
+        self._cache_pop(key)
 
     def __contains__(self, key):
+        if self._cache is not None and self._cache.get(str(key))[0]:
+            return True
+        pending, data = self._lookup_pending(str(key))
+        if pending:
+            return data is not None
+        if self._bloom_miss(str(key)):
+            return False
         result = self._find_one_by_key(key)
         if result:
             return True
@@ -50,31 +117,20 @@ class BigDict(Container):
     def __iter__(self):
         yield from self.keys()
 
-    def keys(self):
-        gen = self.items()
-        while True:
-            try:
-                result = next(gen)
-                yield result[0]
-            except StopIteration:
-                return
-
-    def values(self):
-        gen = self.items()
-        while True:
-            try:
-                result = next(gen)
-                yield result[1]
-            except StopIteration:
-                return
-
-    def items(self):
-        offset = 0
-        result = self._adapter.find_one(self._table, {}, offset=offset)
-        while result:
+    def keys(self, batch_size=None):
+        for key, _ in self.items(batch_size):
+            yield key
+
+    def values(self, batch_size=None):
+        for _, value in self.items(batch_size):
+            yield value
+
+    def items(self, batch_size=None):
+        self.flush()
+        results = self._adapter.find_iter(
+            self._table, {}, batch_size=batch_size or self.BATCH_SIZE)
+        for result in results:
             yield (result[self.KEY], self._loads(result[self.VALUE]))
-            offset += 1
-            result = self._adapter.find_one(self._table, {}, offset=offset)
 
     def get(self, key, default=None):
         try:
@@ -83,23 +139,67 @@ class BigDict(Container):
             return default
 
     def pop(self, key):
-        result = self.__getitem__(key)
-        self.__delitem__(key)
-        return result
+        self.flush()
+        self._cache_pop(key)
+        result = self._adapter.pop_one(self._table, {self.KEY: key})
+        if result is None:
+            raise KeyError(key)
+        return self._loads(result.get(self.VALUE))
 
     def popitem(self):
-        result = self._adapter.find_one(self._table, {})
+        self.flush()
+        result = self._adapter.pop_one(self._table, {})
         if result:
             key = result.get(self.KEY)
             value = result.get(self.VALUE)
-            self.__delitem__(key)
+            self._cache_pop(key)
             return (key, self._loads(value))
         else:
             raise KeyError("popitem(): BigDict is empty")
 
-    def update(self, dic):
+    def update(self, dic, chunk_size=None):
         if not isinstance(dic, dict):
             raise TypeError("Dict required.")
-        for key, value in dic.items():
-            if self.get(key) != value:
-                self.__setitem__(key, value)
+        # Pending writes go first, so the newer values win.
+        self.flush()
+        with self.batch():
+            for chunk in chunked(dic.items(),
+                                 chunk_size or self.BATCH_SIZE):
+                data = [{self.KEY: str(key), self.VALUE: self._dumps(value)}
+                        for key, value in chunk]
+                for row in data:
+                    self._bloom_add(row[self.KEY])
+                self._adapter.upsert_many(self._table, data, [self.KEY])
+                for (key, value), row in zip(chunk, data):
+                    self._cache_put(key, value, row[self.VALUE])
+
+    def _write_pending(self, pending):
+        rows = [{self.KEY: key, self.VALUE: data}
+                for key, data in pending.items() if data is not None]
+        removed = [key for key, data in pending.items() if data is None]
+        with self.batch():
+            for chunk in chunked(rows, self.BATCH_SIZE):
+                self._adapter.upsert_many(self._table, chunk, [self.KEY])
+            for chunk in chunked(removed, self.BATCH_SIZE):
+                self._adapter.remove_in(self._table, self.KEY, chunk)
+
+    def clear(self):
+        super().clear()
+        if self._cache is not None:
+            self._cache.clear()
+
+    def delete(self):
+        super().delete()
+        if self._cache is not None:
+            self._cache.clear()
+
+    @contextmanager
+    def batch(self):
+        # Values cached inside a rolled back batch were never stored.
+        try:
+            with super().batch() as adapter:
+                yield adapter
+        except BaseException:
+            if self._cache is not None:
+                self._cache.clear()
+            raise
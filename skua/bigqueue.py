@@ -1,91 +1,306 @@
 import threading
 from queue import Empty, Full
+from random import uniform
 from time import time
-from .container import Container
+from .container import Container, stable_hash
 from .adapter.database import DatabaseWarning
 
 
 class BigQueue(Container):
     HASH = "_hash"
     OBJECT = "_object"
+    HASHED = True
+    LEASE = "_lease"
 
-    def __init__(self, adapter=None, name=None, maxsize=0):
-        super().__init__(adapter, name)
+    def __init__(self, adapter=None, name=None, maxsize=0, shared=False,
+                 poll_interval=0.01, poll_max=1.0, visibility_timeout=None,
+                 serializer=None, compression=None, compress_threshold=1024,
+                 hash_scheme=None):
+        super().__init__(adapter, name, serializer, compression,
+                         compress_threshold, hash_scheme)
         self.mutex = threading.Lock()
         self.not_empty = threading.Condition(self.mutex)
         self.not_full = threading.Condition(self.mutex)
         self.all_tasks_done = threading.Condition(self.mutex)
         self.unfinished_tasks = 0
         self.maxsize = maxsize
+        # In shared mode several processes or hosts consume the same
+        # table: gets claim rows atomically and waiters poll the table,
+        # since a put in another process cannot notify them. The polling
+        # delay backs off from poll_interval up to poll_max while the
+        # table stays empty.
+        if poll_interval <= 0 or poll_max < poll_interval:
+            raise ValueError("'poll_interval' must be positive and not \
+                             greater than 'poll_max'")
+        self.shared = shared
+        self.poll_interval = poll_interval
+        self.poll_max = poll_max
+        self._poll_delay = poll_interval
+        # With a visibility timeout, get_lease() hides a row until the
+        # lease expires instead of deleting it; ack() deletes it. Expired
+        # leases reappear without a put, so waiters poll as in shared mode.
+        if visibility_timeout is not None and visibility_timeout <= 0:
+            raise ValueError("'visibility_timeout' must be a positive number")
+        self.visibility_timeout = visibility_timeout
+        if visibility_timeout is not None:
+            self.shared = True
         self._init_database()
+        # The size is tracked in memory so the hot paths never run a
+        # COUNT query. Call refresh_size() if other processes write to
+        # the same table.
+        self._size = self._adapter.count(self._table, {})
+
+    def _fields(self):
+        fields = {self.OBJECT: self._adapter.blob,
+                  self.HASH: self._hash_type}
+        if self.visibility_timeout is not None:
+            fields[self.LEASE] = "DOUBLE"
+        return fields
 
     def _init_database(self):
         try:
-            self._adapter.create_table(self._table, {
-                self.OBJECT: self._adapter.blob,
-                self.HASH: "VARCHAR(50)"})
+            self._adapter.create_table(self._table, self._fields())
         except DatabaseWarning:
             pass
+        if self.visibility_timeout is not None:
+            try:
+                self._adapter.create_index(self._table, [self.LEASE])
+            except DatabaseWarning:
+                pass
 
-    def get(self, block=True, timeout=None):
-        with self.not_empty:
-            if not block:
-                if not self.qsize():
+    def _wait_not_empty(self, block, timeout):
+        # Must be called with the mutex held.
+        if not block:
+            if not self.qsize():
+                raise Empty
+        elif timeout is None:
+            while not self.qsize():
+                self.not_empty.wait()
+        elif timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        else:
+            endtime = time() + timeout
+            while not self.qsize():
+                remaining = endtime - time()
+                if remaining <= 0.0:
+                    raise Empty
+                self.not_empty.wait(remaining)
+
+    def _wait(self, condition, timeout=None):
+        if not self.shared:
+            condition.wait(timeout)
+            return
+
+        # Exponential backoff with jitter, so idle consumers of several
+        # processes neither spin nor poll in lock-step. A local notify
+        # resets the delay.
+        delay = max(uniform(self._poll_delay / 2, self._poll_delay),
+                    self.poll_interval)
+        if timeout is None or timeout > delay:
+            timeout = delay
+        if condition.wait(timeout):
+            self._poll_delay = self.poll_interval
+        else:
+            self._poll_delay = min(self._poll_delay * 2, self.poll_max)
+
+    def _claim(self, fetch, block, timeout):
+        # Shared mode: the table is the only source of truth, so try to
+        # claim first and wait only when nothing could be claimed.
+        # Must be called with the mutex held.
+        if block and timeout is not None and timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        endtime = None if timeout is None else time() + timeout
+        while True:
+            try:
+                result = fetch()
+                self._poll_delay = self.poll_interval
+                return result
+            except Empty:
+                if not block:
+                    raise
+            if endtime is None:
+                self._wait(self.not_empty)
+            else:
+                remaining = endtime - time()
+                if remaining <= 0.0:
                     raise Empty
+                self._wait(self.not_empty, remaining)
+
+    def _wait_not_full(self, block, timeout):
+        # Must be called with the mutex held.
+        if self.maxsize > 0:
+            if not block:
+                if self.qsize() >= self.maxsize:
+                    raise Full
             elif timeout is None:
-                while not self.qsize():
-                    self.not_empty.wait()
+                while self.qsize() >= self.maxsize:
+                    self._wait(self.not_full)
             elif timeout < 0:
                 raise ValueError("'timeout' must be a non-negative number")
             else:
                 endtime = time() + timeout
-                while not self.qsize():
+                while self.qsize() >= self.maxsize:
                     remaining = endtime - time()
                     if remaining <= 0.0:
-                        raise Empty
-                    self.not_empty.wait(remaining)
-            item = self._get()
+                        raise Full
+                    self._wait(self.not_full, remaining)
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if self.shared:
+                item = self._claim(self._get, block, timeout)
+            else:
+                self._wait_not_empty(block, timeout)
+                item = self._get()
+            self._size -= 1
             self.not_full.notify()
             return item
 
+    def get_many(self, max_items, block=True, timeout=None):
+        # Wait like get() for at least one item, then take up to
+        # `max_items` with one select and one delete.
+        if max_items < 1:
+            raise ValueError("'max_items' must be a positive number")
+        with self.not_empty:
+            if self.shared:
+                items = self._claim(lambda: self._get_many(max_items),
+                                    block, timeout)
+            else:
+                self._wait_not_empty(block, timeout)
+                items = self._get_many(max_items)
+            self._size -= len(items)
+            self.not_full.notify(len(items))
+            return items
+
+    def get_lease(self, block=True, timeout=None):
+        # Returns (handle, item). The item stays in the table, hidden from
+        # other consumers, until ack(handle) or until the lease expires.
+        if self.visibility_timeout is None:
+            raise RuntimeError("get_lease() requires a visibility_timeout.")
+        with self.not_empty:
+            return self._claim(self._get_lease, block, timeout)
+
+    def _get_lease(self):
+        now = time()
+        lease = now + self.visibility_timeout
+        result = self._adapter.claim_one(self._table, self._visible(now),
+                                         {self.LEASE: lease},
+                                         orderby=self._orderby())
+        if result is None:
+            raise Empty
+        return ((result[self._adapter.ID], lease),
+                self._loads(result.get(self.OBJECT)))
+
+    def ack(self, handle):
+        # A handle whose lease expired and was claimed again no longer
+        # matches, so a late ack cannot delete another consumer's item.
+        id, lease = handle
+        self._adapter.remove(self._table, {self._adapter.ID: id,
+                                           self.LEASE: lease})
+
+    def _visible(self, now=None):
+        if self.visibility_timeout is None:
+            return {}
+        return {self.LEASE: self._adapter.le(now or time())}
+
+    def _orderby(self):
+        # The auto-increment primary key gives FIFO order.
+        return self._adapter.ID
+
     def _get(self):
-        result = self._adapter.find_one(self._table, {})
-        self._adapter.remove(self._table, {self.HASH: result.get(self.HASH)})
+        result = self._adapter.pop_one(self._table, self._visible(),
+                                       orderby=self._orderby())
+        if result is None:
+            # Another consumer emptied the table behind our back.
+            self._size = 0
+            raise Empty
         return self._loads(result.get(self.OBJECT))
 
+    def _get_many(self, max_items):
+        results = self._adapter.pop_many(self._table, self._visible(),
+                                         orderby=self._orderby(),
+                                         limit=max_items)
+        if not results:
+            self._size = 0
+            raise Empty
+        return [self._loads(result.get(self.OBJECT)) for result in results]
+
     def put(self, obj, block=True, timeout=None):
         with self.not_full:
-            if self.maxsize > 0:
-                if not block:
-                    if self.qsize() >= self.maxsize:
-                        raise Full
-                elif timeout is None:
-                    while self.qsize() >= self.maxsize:
-                        self.not_full.wait()
-                elif timeout < 0:
-                    raise ValueError("'timeout' must be a non-negative number")
-                else:
-                    endtime = time() + timeout
-                    while self.qsize() >= self.maxsize:
-                        remaining = endtime - time()
-                        if remaining <= 0.0:
-                            raise Full
-                        self.not_full.wait(remaining)
+            self._wait_not_full(block, timeout)
             self._put(obj)
+            self._size += 1
             self.unfinished_tasks += 1
             self.not_empty.notify()
 
-    def _put(self, obj):
+    def put_many(self, objs, block=True, timeout=None):
+        # On a bounded queue the objects are inserted in as many batches
+        # as free slots allow. If Full is raised, the objects put before
+        # it stay in the queue.
+        objs = list(objs)
+        endtime = None if timeout is None else time() + timeout
+        with self.not_full:
+            while objs:
+                if endtime is None:
+                    self._wait_not_full(block, None)
+                else:
+                    self._wait_not_full(block, max(endtime - time(), 0.0))
+                if self.maxsize > 0:
+                    room = self.maxsize - self.qsize()
+                else:
+                    room = len(objs)
+                batch, objs = objs[:room], objs[room:]
+                self._put_many(batch)
+                self._size += len(batch)
+                self.unfinished_tasks += len(batch)
+                self.not_empty.notify(len(batch))
+
+    def _row(self, obj):
         binary_obj = self._dumps(obj)
-        data = {self.OBJECT: binary_obj,
-                self.HASH:   str(hash(binary_obj))}
+        if self._hash_scheme == "python":
+            digest = str(hash(binary_obj))
+        else:
+            digest = stable_hash(binary_obj)
+        row = {self.OBJECT: binary_obj,
+               self.HASH:   digest}
+        if self.visibility_timeout is not None:
+            row[self.LEASE] = 0
+        return row
+
+    def _put(self, obj):
+        data = self._row(obj)
         if hasattr(self._adapter, "add_one_binary"):
             self._adapter.add_one_binary(self._table, data)
         else:
             self._adapter.add_one(self._table, data)
 
+    def _put_many(self, objs):
+        data = [self._row(obj) for obj in objs]
+        if hasattr(self._adapter, "add_many_binary"):
+            self._adapter.add_many_binary(self._table, data)
+        else:
+            self._adapter.add_many(self._table, data)
+
     def qsize(self):
-        return self.__len__()
+        if self.shared:
+            # Other processes change the table, so the cache is useless.
+            return self._adapter.count(self._table, self._visible())
+        return self._size
+
+    def refresh_size(self):
+        with self.mutex:
+            self._size = self._adapter.count(self._table, {})
+            if self._size:
+                self.not_empty.notify_all()
+            if self.maxsize <= 0 or self._size < self.maxsize:
+                self.not_full.notify_all()
+            return self._size
+
+    def clear(self):
+        with self.mutex:
+            super().clear()
+            self._size = 0
+            self.not_full.notify_all()
 
     def empty(self):
         with self.mutex:
@@ -95,7 +310,9 @@ class BigQueue(Container):
         with self.mutex:
             return 0 < self.maxsize <= self.qsize()
 
-    def task_done(self):
+    def task_done(self, handle=None):
+        if handle is not None:
+            self.ack(handle)
         with self.all_tasks_done:
             unfinished = self.unfinished_tasks - 1
             if unfinished <= 0:
@@ -129,35 +346,30 @@ class BigQueue(Container):
 class BigPriorityQueue(BigQueue):
     PRIORITY = "_priority"
 
-    def _put(self, obj):
+    def _fields(self):
+        fields = super()._fields()
+        fields[self.PRIORITY] = "INT"
+        return fields
+
+    def _row(self, obj):
         if not hasattr(obj, "priority"):
             raise TypeError("no priority attribute.")
 
-        binary_obj = self._dumps(obj)
         if callable(obj.priority):
             priority = obj.priority()
         else:
             priority = obj.priority
-        data = {self.OBJECT: binary_obj,
-                self.PRIORITY: priority,
-                self.HASH: str(hash(binary_obj))}
-        if hasattr(self._adapter, "add_one_binary"):
-            self._adapter.add_one_binary(self._table, data)
-        else:
-            self._adapter.add_one(self._table, data)
+        row = super()._row(obj)
+        row[self.PRIORITY] = priority
+        return row
 
-    def _get(self):
-        result = self._adapter.find_one(self._table, {},
-                                        orderby=self.PRIORITY,
-                                        asc=True)
-        self._adapter.remove(self._table, {self.HASH: result.get(self.HASH)})
-        return self._loads(result.get(self.OBJECT))
+    def _orderby(self):
+        # Insertion order breaks ties between equal priorities.
+        return [self.PRIORITY, self._adapter.ID]
 
     def _init_database(self):
+        super()._init_database()
         try:
-            self._adapter.create_table(self._table, {
-                self.OBJECT: self._adapter.blob,
-                self.PRIORITY: "INT",
-                self.HASH: "VARCHAR(50)"})
+            self._adapter.create_index(self._table, self._orderby())
         except DatabaseWarning:
             pass
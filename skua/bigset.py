@@ -1,21 +1,45 @@
-from .container import Container
+from contextlib import contextmanager
+from uuid import uuid4
+from .container import (Container, MapReduce, canonical_hash, chunked,
+                        stable_hash)
 from .adapter.database import DatabaseWarning
 
 
-class BigSet(Container):
+class BigSet(MapReduce, Container):
     HASH = "_hash"
     OBJECT = "_object"
+    HASHED = True
+    # "canonical" (the default) hashes members by value like hash()
+    # does, but the same in every process; see canonical_hash().
+    # "blake2b" hashes the serialized bytes: opt in for exact byte
+    # identity, as 1 and 1.0, or equal frozensets pickled in another
+    # order, are then different members.
+    HASH_SCHEMES = ("canonical", "blake2b", "python")
+    MAP_COLUMNS = (OBJECT,)
 
-    def __init__(self, adapter=None, name=None):
-        super().__init__(adapter, name)
+    def __init__(self, adapter=None, name=None, serializer=None,
+                 compression=None, compress_threshold=1024,
+                 write_behind=False, flush_size=1000, flush_interval=None,
+                 bloom_capacity=None, bloom_error_rate=0.01,
+                 hash_scheme=None):
+        super().__init__(adapter, name, serializer, compression,
+                         compress_threshold, hash_scheme)
         try:
             self._adapter.create_table(self._table, {
-                self.HASH: "VARCHAR(50)",
+                self.HASH: self._hash_type,
                 self.OBJECT: self._adapter.blob})
         except DatabaseWarning:
             pass
+        try:
+            self._adapter.create_index(self._table, [self.HASH], unique=True)
+        except DatabaseWarning:
+            pass
+        # An add and a later remove of the same object cancel out into
+        # the remove, and the other way round.
+        self._init_write_behind(write_behind, flush_size, flush_interval)
+        self._init_bloom(bloom_capacity, bloom_error_rate, self.HASH)
 
-    def _get_hash(self, obj):
+    def _python_hash(self, obj):
         if not hasattr(obj, "__hash__"):
             raise TypeError(f"unhashable type: {type(obj)}")
         hash = obj.__hash__()
@@ -23,6 +47,20 @@ class BigSet(Container):
             raise TypeError("__hash__ return None.")
         return str(hash)
 
+    def _get_hash(self, obj, data=None):
+        hash = self._python_hash(obj)
+        if self._hash_scheme == "canonical":
+            return canonical_hash(obj)
+        if self._hash_scheme == "blake2b":
+            return stable_hash(data or self._serializer.dumps(obj))
+        return hash
+
+    def _row(self, obj):
+        # Serializes `obj` once for both columns.
+        data = self._serializer.dumps(obj)
+        return {self.HASH: self._get_hash(obj, data),
+                self.OBJECT: self._compress(data)}
+
     def _find_one_by_hash(self, hash):
         return self._adapter.find_one(self._table, {self.HASH: hash})
 
@@ -30,37 +68,58 @@ class BigSet(Container):
         self._adapter.remove(self._table, {self.HASH: hash})
 
     def add(self, obj):
-        hash = self._get_hash(obj)
-        result = self._find_one_by_hash(hash)
-        if not result:
-            data = {self.HASH: hash,
-                    self.OBJECT: self._dumps(obj)}
-
-            if hasattr(self._adapter, "add_one_binary"):
-                self._adapter.add_one_binary(self._table, data)
-            else:
-                self._adapter.add_one(self._table, data)
+        data = self._row(obj)
+        self._bloom_add(data[self.HASH])
+        if self._pending is not None:
+            self._buffer(data[self.HASH], data[self.OBJECT])
+        else:
+            self._adapter.add_ignore(self._table, data)
 
-    def update(self, it):
+    def update(self, it, chunk_size=None):
         if not hasattr(it, "__iter__"):
             raise TypeError(f"{type(it)} is not iterable")
-        for obj in it:
-            self.add(obj)
+        self.flush()
+        with self.batch():
+            for chunk in chunked(it, chunk_size or self.BATCH_SIZE):
+                data = [self._row(obj) for obj in chunk]
+                for row in data:
+                    self._bloom_add(row[self.HASH])
+                self._adapter.add_many_ignore(self._table, data)
 
     def remove(self, obj):
         hash = self._get_hash(obj)
-        self._remove_by_hash(hash)
+        if self._pending is not None:
+            self._buffer(hash, None)
+        else:
+            self._remove_by_hash(hash)
+
+    def _write_pending(self, pending):
+        added = [{self.HASH: hash, self.OBJECT: data}
+                 for hash, data in pending.items() if data is not None]
+        removed = [hash for hash, data in pending.items() if data is None]
+        with self.batch():
+            for chunk in chunked(added, self.BATCH_SIZE):
+                self._adapter.add_many_ignore(self._table, chunk)
+            for chunk in chunked(removed, self.BATCH_SIZE):
+                self._adapter.remove_in(self._table, self.HASH, chunk)
 
     def __iter__(self):
-        offset = 0
-        result = self._adapter.find_one(self._table, {}, offset=offset)
-        while result:
+        yield from self.members()
+
+    def members(self, batch_size=None):
+        self.flush()
+        results = self._adapter.find_iter(
+            self._table, {}, batch_size=batch_size or self.BATCH_SIZE)
+        for result in results:
             yield self._loads(result.get(self.OBJECT))
-            offset += 1
-            result = self._adapter.find_one(self._table, {}, offset=offset)
 
     def __contains__(self, obj):
         hash = self._get_hash(obj)
+        pending, data = self._lookup_pending(hash)
+        if pending:
+            return data is not None
+        if self._bloom_miss(hash):
+            return False
         result = self._find_one_by_hash(hash)
         if result:
             return True
@@ -68,9 +127,201 @@ class BigSet(Container):
             return False
 
     def pop(self):
-        result = self._adapter.find_one(self._table, {})
+        self.flush()
+        result = self._adapter.pop_one(self._table, {})
         if result:
-            self._remove_by_hash(result.get(self.HASH))
             return self._loads(result.get(self.OBJECT))
         else:
             raise KeyError("BigSet empty.")
+
+    # Set algebra. Operands are other BigSets on the same adapter with
+    # the same encoding, combined by the database without fetching any
+    # row; any other iterable is first loaded into a temporary table.
+    # Results are new tables. Given a `name` (union(..., name=...)) the
+    # table is kept; otherwise, as for the operators, it is temporary
+    # and dropped by close() or when the result is garbage collected.
+
+    _temporary = False
+
+    def _derived(self, name=None):
+        result = BigSet(self._adapter, name or self._result_name("tmp"),
+                        self._serializer, self._compressor,
+                        self._compress_threshold,
+                        hash_scheme=self._hash_scheme)
+        result._close_adapter = False
+        result._temporary = name is None
+        return result
+
+    def _drop_temporary(self):
+        if self._temporary and getattr(self, "_adapter", None) is not None:
+            self._temporary = False
+            if self._adapter.table_exit(self._table):
+                self.delete()
+
+    def close(self):
+        self._drop_temporary()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._drop_temporary()
+        except Exception:
+            pass
+        super().__del__()
+
+    def _compatible(self, other):
+        return isinstance(other, BigSet) and \
+            other._adapter is self._adapter and \
+            other._serializer.name == self._serializer.name and \
+            other._hash_scheme == self._hash_scheme and \
+            other._meta_get("compression") == self._meta_get("compression")
+
+    @contextmanager
+    def _operand(self, other):
+        if self._compatible(other):
+            other.flush()
+            yield other
+            return
+        if not hasattr(other, "__iter__"):
+            raise TypeError(f"{type(other)} is not iterable")
+        temp = self._derived()
+        try:
+            temp.update(other)
+            yield temp
+        finally:
+            temp.close()
+
+    def _result_name(self, op):
+        return f"{self._table}_{op}_{uuid4().hex[:12]}"
+
+    def _copy_into(self, result, other=None, negate=False):
+        self._adapter.copy_rows(self._table, result._table,
+                                [self.HASH, self.OBJECT],
+                                other=other, field=self.HASH,
+                                negate=negate)
+
+    def union(self, *others, name=None):
+        self.flush()
+        result = self._derived(name)
+        self._copy_into(result)
+        for other in others:
+            result |= other
+        return result
+
+    def intersection(self, *others, name=None):
+        self.flush()
+        result = self._derived(name)
+        if not others:
+            self._copy_into(result)
+            return result
+        with self._operand(others[0]) as other:
+            self._copy_into(result, other._table)
+        for other in others[1:]:
+            result &= other
+        return result
+
+    def difference(self, *others, name=None):
+        self.flush()
+        result = self._derived(name)
+        if not others:
+            self._copy_into(result)
+            return result
+        with self._operand(others[0]) as other:
+            self._copy_into(result, other._table, negate=True)
+        for other in others[1:]:
+            result -= other
+        return result
+
+    def __ior__(self, other):
+        self.flush()
+        with self._operand(other) as other:
+            other._copy_into(self)
+        if self._bloom is not None:
+            self._scan_bloom()
+        return self
+
+    def __iand__(self, other):
+        self.flush()
+        with self._operand(other) as other:
+            self._adapter.remove_join(self._table, other._table, self.HASH,
+                                      negate=True)
+        return self
+
+    def __isub__(self, other):
+        self.flush()
+        with self._operand(other) as other:
+            self._adapter.remove_join(self._table, other._table, self.HASH)
+        return self
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def intersection_update(self, *others):
+        for other in others:
+            self &= other
+
+    def difference_update(self, *others):
+        for other in others:
+            self -= other
+
+    def _subset_of(self, other):
+        # Both compatible BigSets: no member of self is missing in other.
+        return self._adapter.count_join(self._table, other._table,
+                                        self.HASH, negate=True) == 0
+
+    def issubset(self, other):
+        self.flush()
+        with self._operand(other) as other:
+            return self._subset_of(other)
+
+    def issuperset(self, other):
+        self.flush()
+        with self._operand(other) as other:
+            return other._subset_of(self)
+
+    def isdisjoint(self, other):
+        self.flush()
+        with self._operand(other) as other:
+            return self._adapter.count_join(self._table, other._table,
+                                            self.HASH) == 0
+
+    def __le__(self, other):
+        return self.issubset(other)
+
+    def __ge__(self, other):
+        return self.issuperset(other)
+
+    # Proper subset and superset compare sizes of the operand's table,
+    # where duplicates of a plain iterable have been folded.
+
+    def __lt__(self, other):
+        self.flush()
+        with self._operand(other) as other:
+            return self._subset_of(other) and len(self) < len(other)
+
+    def __gt__(self, other):
+        self.flush()
+        with self._operand(other) as other:
+            return other._subset_of(self) and len(self) > len(other)
+
+    def _iter_join(self, other, negate, batch_size):
+        self.flush()
+        with self._operand(other) as other:
+            results = self._adapter.find_iter_join(
+                self._table, other._table, self.HASH, negate,
+                batch_size or self.BATCH_SIZE)
+            for result in results:
+                yield self._loads(result.get(self.OBJECT))
+
+    def iter_intersection(self, other, batch_size=None):
+        # Streams the members also in `other`, no table is created.
+        return self._iter_join(other, False, batch_size)
+
+    def iter_difference(self, other, batch_size=None):
+        return self._iter_join(other, True, batch_size)
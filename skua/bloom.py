@@ -0,0 +1,71 @@
+import math
+import struct
+import threading
+from hashlib import blake2b
+
+
+class BloomFilter:
+    # A plain Bloom filter over string (or integer) keys. It answers
+    # "definitely not present" or "maybe present"; removals are not
+    # supported, a removed key only keeps costing a lookup.
+    HEADER = struct.Struct("<QQQ")
+
+    def __init__(self, capacity, error_rate=0.01):
+        if capacity < 1:
+            raise ValueError("'capacity' must be a positive number")
+        if not 0 < error_rate < 1:
+            raise ValueError("'error_rate' must be between 0 and 1")
+        nbits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        nhashes = max(1, round(nbits / capacity * math.log(2)))
+        self._init(nbits, nhashes)
+
+    def _init(self, nbits, nhashes, count=0, bits=None):
+        self._lock = threading.Lock()
+        self.nbits = nbits
+        self.nhashes = nhashes
+        self.count = count
+        self.bits = bits if bits is not None else \
+            bytearray((nbits + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions out of one 128-bit digest.
+        digest = blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.nbits for i in range(self.nhashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        # A lost bit would turn into a false "not present".
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    def clear(self):
+        with self._lock:
+            self.bits = bytearray(len(self.bits))
+            self.count = 0
+
+    @property
+    def false_positive_rate(self):
+        # Expected rate for the number of keys added so far.
+        return (1 - math.exp(-self.nhashes * self.count / self.nbits)) \
+            ** self.nhashes
+
+    def to_bytes(self):
+        with self._lock:
+            return self.HEADER.pack(self.nbits, self.nhashes, self.count) + \
+                bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        nbits, nhashes, count = cls.HEADER.unpack_from(data)
+        bloom = cls.__new__(cls)
+        bloom._init(nbits, nhashes, count,
+                    bytearray(data[cls.HEADER.size:]))
+        return bloom
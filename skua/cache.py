@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict, namedtuple
+from time import monotonic
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "entries", "nbytes"])
+
+
+class LRUCache:
+    # Bounded by number of entries and/or by the total size given to
+    # put(), least recently used entries are evicted first. Entries older
+    # than `ttl` seconds are dropped on access.
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("'max_entries' must be a positive number")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError("'max_bytes' must be a positive number")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("'ttl' must be a positive number")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # Returns (True, value) on a hit and (False, None) on a miss.
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, size, expires = entry
+                if expires is None or expires > monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                self._remove(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, size=0):
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Would evict everything else, do not cache it at all.
+            self.pop(key)
+            return
+        expires = None if self.ttl is None else monotonic() + self.ttl
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, size, expires)
+            self._nbytes += size
+            while (self.max_entries is not None and
+                   len(self._data) > self.max_entries) or \
+                    (self.max_bytes is not None and
+                     self._nbytes > self.max_bytes):
+                _, (_, size, _) = self._data.popitem(last=False)
+                self._nbytes -= size
+
+    def _remove(self, key):
+        # Must be called with the lock held.
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._nbytes -= entry[1]
+
+    def pop(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._nbytes = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, len(self._data),
+                             self._nbytes)
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,56 @@
+import lzma
+import zlib
+
+
+class Compressor:
+    # `name` is recorded in the table metadata like the serializer's.
+    # Subclass it to plug in a faster codec (lz4, zstd, ...).
+    name = None
+
+    def compress(self, data):
+        raise NotImplementedError
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+
+class ZlibCompressor(Compressor):
+    name = "zlib"
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LZMACompressor(Compressor):
+    name = "lzma"
+
+    def __init__(self, preset=None):
+        self.preset = preset
+
+    def compress(self, data):
+        return lzma.compress(data, preset=self.preset)
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+
+COMPRESSORS = {
+    "zlib": ZlibCompressor,
+    "lzma": LZMACompressor,
+}
+
+
+def get_compressor(compression=None):
+    if compression is None or compression == "none":
+        return None
+    if isinstance(compression, Compressor):
+        return compression
+    if compression not in COMPRESSORS:
+        raise ValueError(f"Unknown compression {compression}.")
+    return COMPRESSORS[compression]()
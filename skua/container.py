@@ -1,18 +1,235 @@
-import pickle
-from .adapter.database import ABCDatabase
+import atexit
+import numbers
+import os
+import threading
+import weakref
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from hashlib import blake2b
+from itertools import islice
+from .adapter.database import ABCDatabase, DatabaseWarning
 from .adapter.sqlite import SQLiteDB
+from .bloom import BloomFilter
+from .compression import get_compressor
+from .serializer import Serializer, get_serializer
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stable_hash(data):
+    # 64-bit blake2b digest of an encoded value, as a signed integer so
+    # it fits a BIGINT column. Unlike hash() it is the same in every
+    # process, whatever PYTHONHASHSEED is.
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "little",
+                          signed=True)
+
+
+def canonical_hash(obj):
+    # stable_hash() of a canonical encoding of a hashable object, so
+    # that objects comparing equal hash equal in every process: 1, 1.0
+    # and True, bytes and bytearray, tuples item by item and frozensets
+    # in any order. Other types fall back to their __hash__, which is
+    # only stable across processes if it does not hash str or bytes.
+    return stable_hash(_canonical(obj))
+
+
+def _canonical(obj):
+    if obj is None:
+        return b"n"
+    if isinstance(obj, str):
+        return b"s" + obj.encode("utf-8", "surrogatepass")
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return b"b" + bytes(obj)
+    if isinstance(obj, numbers.Number):
+        return _canonical_number(obj)
+    if isinstance(obj, tuple):
+        return b"t" + b"".join(_canonical_digest(item) for item in obj)
+    if isinstance(obj, frozenset):
+        return b"f" + b"".join(sorted(_canonical_digest(item)
+                                      for item in obj))
+    return b"h" + str(hash(obj)).encode("ascii")
+
+
+def _canonical_digest(obj):
+    return blake2b(_canonical(obj), digest_size=8).digest()
+
+
+def _canonical_number(number):
+    # Equal numbers of different types share one encoding: integral
+    # values as int, the others as float where that is exact.
+    if isinstance(number, complex):
+        if number.imag:
+            return f"c{number.real.hex()},{number.imag.hex()}" \
+                .encode("ascii")
+        number = number.real
+    try:
+        if number == int(number):
+            return b"i" + str(int(number)).encode("ascii")
+    except (ValueError, OverflowError, TypeError):
+        pass
+    try:
+        if number == float(number):
+            return b"r" + float(number).hex().encode("ascii")
+    except (ValueError, OverflowError, TypeError):
+        pass
+    return b"h" + str(hash(number)).encode("ascii")
+
+
+def _decode(serializer, compressor, data):
+    if compressor is not None:
+        if data[:1] == Container.COMPRESSED:
+            data = compressor.decompress(data[1:])
+        else:
+            data = data[1:]
+    return serializer.loads(data)
+
+
+def _map_partition(loads, func, reducer, rows):
+    # Decode, map and reduce the rows of one partition, in a worker
+    # thread or process. Every row ends with the encoded value.
+    found, result = False, None
+    for row in rows:
+        value = func(*row[:-1], loads(row[-1]))
+        if found:
+            result = reducer(result, value)
+        else:
+            found, result = True, value
+    return found, result
+
+
+# Write-behind containers still holding writes when the interpreter exits.
+_write_behind = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_write_behind():
+    for container in list(_write_behind):
+        try:
+            container.flush()
+        except Exception:
+            pass
+
+
+class MapReduce:
+    # map_reduce() for BigDict and BigSet, mixed in before Container.
+    # MAP_COLUMNS are the columns passed to the workers, the value
+    # column last.
+    MAP_COLUMNS = ()
+
+    def map_reduce(self, func, reducer, initial=None, workers=None,
+                   executor="thread", partition_size=None):
+        # reduce(reducer, map(func, rows)) over the table, in parallel.
+        # The table is cut into primary key ranges of `partition_size`
+        # rows, which `workers` threads decode, map and reduce, or as
+        # many processes with executor="process". The ranges are fetched
+        # one at a time, or by `workers` threads when the adapter can
+        # serve concurrent reads (pooled MySQL, SQLite readers, Mongo).
+        # Partial results are combined in table order, so `reducer`
+        # must be associative. With "process", func and reducer must
+        # be picklable. At most 2 * workers fetched partitions wait to
+        # be mapped at a time.
+        if executor not in ("thread", "process"):
+            raise ValueError("'executor' must be 'thread' or 'process'")
+        workers = workers or os.cpu_count() or 1
+        self.flush()
+        size = partition_size or self.BATCH_SIZE * 10
+        bounds = self._adapter.partition_bounds(self._table, size)
+        ranges = list(zip([None] + bounds, bounds + [None]))
+        loads = partial(_decode, self._serializer, self._compressor)
+        fetchers = workers if self._adapter.concurrent_reads else 1
+        mapper_class = ThreadPoolExecutor if executor == "thread" \
+            else ProcessPoolExecutor
+        slots = threading.BoundedSemaphore(2 * workers)
+
+        def fetch(low, high):
+            return [tuple(row[column] for column in self.MAP_COLUMNS)
+                    for row in self._adapter.find_range(
+                        self._table, low, high, min(size, self.BATCH_SIZE),
+                        list(self.MAP_COLUMNS))]
+
+        def submit(low, high):
+            slots.acquire()
+            try:
+                future = mappers.submit(_map_partition, loads, func,
+                                        reducer, fetch(low, high))
+            except BaseException:
+                slots.release()
+                raise
+            future.add_done_callback(lambda _: slots.release())
+            return future
+
+        with ThreadPoolExecutor(fetchers) as fetch_pool, \
+                mapper_class(workers) as mappers:
+            futures = [fetch_pool.submit(submit, low, high)
+                       for low, high in ranges]
+            partials = [future.result().result() for future in futures]
+
+        results = [result for found, result in partials if found]
+        if initial is not None:
+            results.insert(0, initial)
+        if not results:
+            raise TypeError("map_reduce() of empty container with no \
+                            initial value")
+        result = results[0]
+        for value in results[1:]:
+            result = reducer(result, value)
+        return result
 
 
 class Container:
-    @classmethod
-    def _loads(cls, data):
-        return pickle.loads(data)
+    BATCH_SIZE = 1000
+    # Per-container settings, one row per (table, key).
+    META_TABLE = "skua_metadata"
+    META_NAME = "_table"
+    META_KEY = "_key"
+    META_VALUE = "_value"
+    # With compression every value gets a one byte header, telling
+    # whether the rest is compressed.
+    PLAIN = b"\x00"
+    COMPRESSED = b"\x01"
+    # Write-behind buffer, key -> encoded value (None for a delete).
+    _pending = None
+    _flush_timer = None
+    _write_lock = nullcontext()
+    # False for containers made internally on another container's
+    # adapter, which must not close it.
+    _close_adapter = True
+    # Optional membership prefilter, saved in chunks of BLOOM_CHUNK bytes.
+    _bloom = None
+    BLOOM_CHUNK = 60000
+    CHUNK = "_chunk"
+    DATA = "_data"
+    # How BigSet and BigQueue fill their hash column: "blake2b" is
+    # stable_hash() of the serialized value.
+    HASH_SCHEMES = ("blake2b", "python")
+    HASHED = False
+
+    def _loads(self, data):
+        return _decode(self._serializer, self._compressor, data)
 
-    @classmethod
-    def _dumps(csl, data):
-        return pickle.dumps(data, 2)
+    def _dumps(self, data):
+        return self._compress(self._serializer.dumps(data))
 
-    def __init__(self, adapter=None, name=None):
+    def _compress(self, data):
+        if self._compressor is None:
+            return data
+        # Small values are not worth it, and some do not shrink at all.
+        if len(data) >= self._compress_threshold:
+            compressed = self._compressor.compress(data)
+            if len(compressed) < len(data):
+                return self.COMPRESSED + compressed
+        return self.PLAIN + data
+
+    def __init__(self, adapter=None, name=None, serializer=None,
+                 compression=None, compress_threshold=1024, hash_scheme=None):
         if adapter and not isinstance(adapter, ABCDatabase):
             raise TypeError("adapter should be a database object.")
         elif adapter:
@@ -26,15 +243,336 @@ class Container:
             self._adapter.connect()
 
         self._table = name or f"skua_{self.__class__.__name__}"
+        self._compress_threshold = compress_threshold
+        try:
+            self._init_meta()
+            new = self._meta_get("serializer") is None and \
+                not self._adapter.table_exit(self._table)
+            self._serializer = self._init_serializer(serializer, new)
+            self._compressor = self._init_compression(compression, new)
+            if self.HASHED:
+                self._init_hash(hash_scheme)
+        except Exception:
+            # Do not let __del__ close an adapter the caller still owns.
+            if adapter:
+                self._adapter = None
+            raise
+
+    def _init_meta(self):
+        try:
+            self._adapter.create_table(self.META_TABLE, {
+                self.META_NAME: "VARCHAR(128)",
+                self.META_KEY: "VARCHAR(64)",
+                self.META_VALUE: "VARCHAR(255)"})
+        except DatabaseWarning:
+            pass
+        try:
+            self._adapter.create_index(self.META_TABLE,
+                                       [self.META_NAME, self.META_KEY],
+                                       unique=True)
+        except DatabaseWarning:
+            pass
+
+    def _meta_get(self, key, default=None):
+        result = self._adapter.find_one(self.META_TABLE,
+                                        {self.META_NAME: self._table,
+                                         self.META_KEY: key})
+        return result[self.META_VALUE] if result else default
+
+    def _meta_set(self, key, value):
+        self._adapter.upsert(self.META_TABLE,
+                             {self.META_NAME: self._table,
+                              self.META_KEY: key,
+                              self.META_VALUE: value},
+                             [self.META_NAME, self.META_KEY])
+
+    def _meta_delete(self, key):
+        self._adapter.remove(self.META_TABLE, {self.META_NAME: self._table,
+                                               self.META_KEY: key})
+
+    def _init_serializer(self, serializer, new):
+        # The first container on a table records its codec; later ones
+        # follow it, or fail if they ask for another one. Tables written
+        # before the codec was recorded hold pickles.
+        stored = self._meta_get("serializer")
+        if stored is None and new:
+            serializer = get_serializer(serializer)
+            self._meta_set("serializer", serializer.name)
+            return serializer
+        if stored is None:
+            stored = "pickle"
+            self._meta_set("serializer", stored)
+        if serializer is None:
+            return get_serializer(stored)
+        if not isinstance(serializer, Serializer):
+            serializer = get_serializer(serializer)
+        if serializer.name != stored:
+            raise ValueError(f"Table {self._table} is encoded with \
+                             {stored}, not {serializer.name}.")
+        return serializer
+
+    def _init_compression(self, compression, new):
+        # Only a new table can get the row header; tables without a
+        # recorded compression are stored plain.
+        stored = self._meta_get("compression")
+        if stored is None and new:
+            compressor = get_compressor(compression)
+            self._meta_set("compression",
+                           compressor.name if compressor else "none")
+            return compressor
+        stored = stored or "none"
+        if compression is None:
+            return get_compressor(stored)
+        compressor = get_compressor(compression)
+        name = compressor.name if compressor else "none"
+        if name != stored:
+            raise ValueError(f"Table {self._table} is stored with \
+                             compression {stored}, not {name}.")
+        return compressor
+
+    def _init_hash(self, scheme):
+        # New tables use the first of HASH_SCHEMES unless told otherwise,
+        # stored in a BIGINT column. Tables created before the scheme
+        # was recorded keep Python's hash() as text, which only agrees
+        # between processes started with the same PYTHONHASHSEED.
+        if scheme is not None and scheme not in self.HASH_SCHEMES:
+            raise ValueError(f"Unknown hash scheme {scheme}.")
+        stored = self._meta_get("hash")
+        if stored is None:
+            if self._adapter.table_exit(self._table):
+                stored = "python"
+            else:
+                stored = scheme or self.HASH_SCHEMES[0]
+            self._meta_set("hash", stored)
+        if scheme is not None and scheme != stored:
+            raise ValueError(f"Table {self._table} is hashed with \
+                             {stored}, not {scheme}.")
+        self._hash_scheme = stored
+
+    @property
+    def _hash_type(self):
+        return "VARCHAR(50)" if self._hash_scheme == "python" else "BIGINT"
+
+    @contextmanager
+    def batch(self):
+        # with container.batch(): ... commits all writes in the block at
+        # once, or none of them if it raises.
+        with self._write_lock:
+            with self._adapter.transaction() as adapter:
+                yield adapter
+
+    def _init_write_behind(self, write_behind, flush_size, flush_interval):
+        # Mutations are coalesced per key in memory, last write wins,
+        # and written in one transaction once `flush_size` keys are
+        # pending, on flush(), close() or at interpreter exit. Set
+        # `flush_interval` to also flush that many seconds after the
+        # first of them; that runs on a timer thread, so it needs an
+        # adapter that may be used from several threads (SQLite, MongoDB
+        # or a pooled MySQL).
+        if not write_behind:
+            return
+        if flush_size < 1:
+            raise ValueError("'flush_size' must be a positive number")
+        if flush_interval is not None and flush_interval <= 0:
+            raise ValueError("'flush_interval' must be a positive number")
+        if flush_interval is not None and not self._adapter.thread_safe:
+            raise ValueError("'flush_interval' needs a thread-safe adapter, \
+                             use a pooled one or flush_interval=None")
+        # Lock order: _write_lock (held by batch() and flush()), then the
+        # adapter's transaction lock, then _pending_lock, which is never
+        # held across I/O.
+        self._write_lock = threading.RLock()
+        self._pending = {}
+        self._flushing = {}
+        self._pending_lock = threading.RLock()
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        _write_behind.add(self)
+
+    def _buffer(self, key, data):
+        with self._pending_lock:
+            self._pending[key] = data
+            full = len(self._pending) >= self._flush_size
+            if not full and self._flush_interval is not None and \
+                    self._flush_timer is None:
+                self._flush_timer = threading.Timer(self._flush_interval,
+                                                    self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if full:
+            self.flush()
+
+    def _lookup_pending(self, key):
+        # Returns (True, data) if `key` has a pending write, including
+        # one that is being flushed right now.
+        if self._pending is None:
+            return False, None
+        with self._pending_lock:
+            for pending in (self._pending, self._flushing):
+                if key in pending:
+                    return True, pending[key]
+        return False, None
+
+    def _write_pending(self, pending):
+        raise NotImplementedError
+
+    def flush(self):
+        if self._pending is None:
+            return
+        with self._write_lock:
+            with self._pending_lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, {}
+                self._flushing = pending
+            try:
+                self._write_pending(pending)
+            except BaseException:
+                # Keep the writes, newer ones first.
+                with self._pending_lock:
+                    pending.update(self._pending)
+                    self._pending = pending
+                raise
+            finally:
+                with self._pending_lock:
+                    self._flushing = {}
+
+    def _discard_pending(self):
+        if self._pending is None:
+            return
+        with self._write_lock, self._pending_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self._pending = {}
+
+    def _init_bloom(self, capacity, error_rate, column):
+        # A Bloom filter over `column` answers most lookups of missing
+        # keys without a query. It only sees writes made through this
+        # object, so other writers must not add to the table meanwhile.
+        # It is saved by save_bloom() and close(), and reloaded if the
+        # table still holds as many rows as when it was saved; any write
+        # after the save drops the saved copy first.
+        if capacity is None:
+            return
+        self._bloom_column = column
+        self._bloom_table = f"{self._table}_bloom"
+        try:
+            self._adapter.create_table(self._bloom_table, {
+                self.CHUNK: "INT",
+                self.DATA: self._adapter.blob})
+        except DatabaseWarning:
+            pass
+        self._bloom_saved = False
+        bloom = BloomFilter(capacity, error_rate)
+        loaded = self._load_bloom()
+        if loaded is not None and loaded.nbits == bloom.nbits and \
+                loaded.nhashes == bloom.nhashes:
+            self._bloom = loaded
+            self._bloom_saved = True
+            return
+        self._bloom = bloom
+        self._scan_bloom()
+
+    def _scan_bloom(self):
+        # (Re)build the filter from the table.
+        self._meta_delete("bloom")
+        self._bloom_saved = False
+        self._bloom.clear()
+        for row in self._adapter.find_iter(self._table, {},
+                                           columns=[self._bloom_column]):
+            self._bloom.add(row[self._bloom_column])
+
+    def _load_bloom(self):
+        rows = self._meta_get("bloom")
+        if rows is None or \
+                int(rows) != self._adapter.count(self._table, {}):
+            return None
+        chunks = self._adapter.find_many(self._bloom_table, {},
+                                         orderby=self.CHUNK)
+        if not chunks:
+            return None
+        return BloomFilter.from_bytes(
+            b"".join(chunk[self.DATA] for chunk in chunks))
+
+    def save_bloom(self):
+        if self._bloom is None:
+            return
+        self.flush()
+        data = self._bloom.to_bytes()
+        chunks = [{self.CHUNK: i,
+                   self.DATA: data[offset:offset + self.BLOOM_CHUNK]}
+                  for i, offset in enumerate(range(0, len(data),
+                                                   self.BLOOM_CHUNK))]
+        with self.batch():
+            self._adapter.remove(self._bloom_table, {})
+            if hasattr(self._adapter, "add_many_binary"):
+                self._adapter.add_many_binary(self._bloom_table, chunks)
+            else:
+                self._adapter.add_many(self._bloom_table, chunks)
+            self._meta_set("bloom",
+                           str(self._adapter.count(self._table, {})))
+        self._bloom_saved = True
+
+    def _drop_saved_bloom(self):
+        if self._bloom_saved:
+            self._meta_delete("bloom")
+            self._bloom_saved = False
+
+    def _bloom_add(self, key):
+        if self._bloom is None:
+            return
+        self._drop_saved_bloom()
+        self._bloom.add(key)
+
+    def _bloom_miss(self, key):
+        # True only if `key` is certainly not in the table.
+        return self._bloom is not None and key not in self._bloom
+
+    @property
+    def false_positive_rate(self):
+        if self._bloom is None:
+            return None
+        return self._bloom.false_positive_rate
+
+    def close(self):
+        self.flush()
+        if self._adapter is not None:
+            self.save_bloom()
+        _write_behind.discard(self)
+        adapter, self._adapter = self._adapter, None
+        if adapter is not None and self._close_adapter:
+            adapter.close()
 
     def clear(self):
+        self._discard_pending()
         self._adapter.remove(self._table, {})
+        if self._bloom is not None:
+            self._drop_saved_bloom()
+            self._bloom.clear()
 
     def __del__(self):
-        self._adapter.close()
+        if self._pending:
+            try:
+                self.flush()
+            except Exception:
+                pass
+        if getattr(self, "_adapter", None) is not None and \
+                self._close_adapter:
+            self._adapter.close()
 
     def __len__(self):
+        self.flush()
         return self._adapter.count(self._table, {})
 
     def delete(self):
+        self._discard_pending()
+        if self._bloom is not None:
+            # Gone with its table, so close() has nothing to save.
+            self._bloom = None
+            self._adapter.delete_table(self._bloom_table)
         self._adapter.delete_table(self._table)
+        self._adapter.remove(self.META_TABLE, {self.META_NAME: self._table})
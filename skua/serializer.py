@@ -0,0 +1,133 @@
+import json
+import pickle
+import struct
+from functools import partial
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Serializer:
+    # `name` is recorded in the table metadata, so a container opened
+    # later decodes the rows with the codec that wrote them.
+    name = None
+
+    def dumps(self, obj):
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    # With out_of_band, buffers exposed through PickleBuffer (NumPy
+    # arrays, bytearray, ...) are appended to the pickle stream instead
+    # of being copied into it, and loads() hands out views of the row
+    # data, so large arrays are not copied again. Such arrays are
+    # read-only, like the bytes they point into.
+    HEADER = struct.Struct("<I")
+    LENGTH = struct.Struct("<Q")
+
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL, out_of_band=False):
+        if out_of_band and protocol < 5:
+            raise ValueError("Out-of-band buffers need pickle protocol 5.")
+        self.protocol = protocol
+        self.out_of_band = out_of_band
+
+    @property
+    def name(self):
+        return "pickle-oob" if self.out_of_band else "pickle"
+
+    def dumps(self, obj):
+        if not self.out_of_band:
+            return pickle.dumps(obj, self.protocol)
+
+        buffers = []
+        data = pickle.dumps(obj, self.protocol,
+                            buffer_callback=buffers.append)
+        buffers = [buffer.raw() for buffer in buffers]
+        header = self.HEADER.pack(len(buffers)) + b"".join(
+            self.LENGTH.pack(buffer.nbytes) for buffer in buffers)
+        return b"".join([header, self.LENGTH.pack(len(data)), data,
+                         *buffers])
+
+    def loads(self, data):
+        if not self.out_of_band:
+            return pickle.loads(data)
+
+        view = memoryview(data)
+        count, = self.HEADER.unpack_from(view)
+        offset = self.HEADER.size
+        lengths = []
+        for _ in range(count + 1):
+            lengths.append(self.LENGTH.unpack_from(view, offset)[0])
+            offset += self.LENGTH.size
+        data_length = lengths.pop()
+        stream = view[offset:offset + data_length]
+        offset += data_length
+        buffers = []
+        for length in lengths:
+            buffers.append(view[offset:offset + length])
+            offset += length
+        return pickle.loads(stream, buffers=buffers)
+
+
+class JSONSerializer(Serializer):
+    # Plain data only; tuples come back as lists.
+    name = "json"
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(bytes(data))
+
+
+class MsgpackSerializer(Serializer):
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack serializer requires msgpack.")
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class RawSerializer(Serializer):
+    # Stores bytes-like values as they are.
+    name = "raw"
+
+    def dumps(self, obj):
+        if isinstance(obj, bytes):
+            return obj
+        if isinstance(obj, (bytearray, memoryview)):
+            return bytes(obj)
+        raise TypeError(f"bytes-like object required, not {type(obj)}")
+
+    def loads(self, data):
+        return data
+
+
+SERIALIZERS = {
+    "pickle": PickleSerializer,
+    "pickle-oob": partial(PickleSerializer, out_of_band=True),
+    "json": JSONSerializer,
+    "msgpack": MsgpackSerializer,
+    "raw": RawSerializer,
+}
+
+
+def get_serializer(serializer=None):
+    if serializer is None:
+        serializer = "pickle"
+    if isinstance(serializer, Serializer):
+        return serializer
+    if serializer not in SERIALIZERS:
+        raise ValueError(f"Unknown serializer {serializer}.")
+    return SERIALIZERS[serializer]()
@@ -0,0 +1,371 @@
+import threading
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, count, islice
+from queue import Empty
+from time import time
+from .adapter.database import ABCDatabase
+from .bigdict import BigDict
+from .bigqueue import BigQueue
+from .bigset import BigSet
+from .container import canonical_hash, stable_hash
+
+
+class HashRing:
+    # Consistent hashing: every node owns `replicas` points on a ring of
+    # 64-bit digests and a key belongs to the node of the first point
+    # at or after its own digest. Adding a node moves only about 1/N of
+    # the keys, and the placement is the same in every process.
+    def __init__(self, nodes, replicas=100):
+        if replicas < 1:
+            raise ValueError("'replicas' must be a positive number")
+        points = sorted((stable_hash(f"{node}:{i}".encode("utf-8")), node)
+                        for node in nodes for i in range(replicas))
+        if not points:
+            raise ValueError("HashRing needs at least one node.")
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get(self, key):
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        elif isinstance(key, int):
+            key = key.to_bytes(8, "little", signed=True)
+        i = bisect(self._points, stable_hash(key)) % len(self._points)
+        return self._nodes[i]
+
+
+class ShardedContainer:
+    # Spreads one logical container over several tables, `{name}_{i}`,
+    # one per shard. `adapters` is a list with one adapter per shard
+    # (several SQLite files or MySQL servers), or a single adapter split
+    # into `shards` tables. Other keyword arguments go to every shard.
+    #
+    # Whole-container operations (len, iteration, clear, ...) run on all
+    # shards at once, one thread per adapter. Shards on the same
+    # unpooled adapter share its connection, so they are visited one
+    # after the other by that adapter's thread.
+    container_class = None
+
+    def __init__(self, adapters=None, shards=None, name=None, replicas=100,
+                 **kwargs):
+        if adapters is None or isinstance(adapters, ABCDatabase):
+            adapters = [adapters] * (shards or 1)
+        else:
+            adapters = list(adapters)
+            if shards is not None and shards != len(adapters):
+                raise ValueError("'shards' does not match the number of \
+                                 adapters.")
+        if not adapters:
+            raise ValueError("At least one shard is required.")
+        base = name or f"skua_{self.container_class.__name__}"
+        self.shards = []
+        try:
+            for i, adapter in enumerate(adapters):
+                self.shards.append(self.container_class(
+                    adapter, f"{base}_{i}", **kwargs))
+        except Exception:
+            # Leave the caller's adapters open.
+            for shard, adapter in zip(self.shards, adapters):
+                if adapter is not None:
+                    shard._close_adapter = False
+            raise
+        self._ring = HashRing(range(len(self.shards)), replicas)
+        # Only the first shard on an adapter closes it.
+        owners = set()
+        for shard in self.shards:
+            if id(shard._adapter) in owners:
+                shard._close_adapter = False
+            owners.add(id(shard._adapter))
+
+        groups = {}
+        for shard in self.shards:
+            adapter = shard._adapter
+            key = id(shard) if adapter.pooled else id(adapter)
+            groups.setdefault(key, []).append(shard)
+        self._groups = list(groups.values())
+        self._executor = ThreadPoolExecutor(max_workers=len(self._groups))
+
+    def _shard(self, key):
+        return self.shards[self._ring.get(key)]
+
+    def _map(self, func, *args):
+        # func(shard, *args) on every shard, results in shard order.
+        def run(group):
+            return [(shard, func(shard, *args)) for shard in group]
+
+        futures = [self._executor.submit(run, group)
+                   for group in self._groups]
+        results = dict((id(shard), result) for future in futures
+                       for shard, result in future.result())
+        return [results[id(shard)] for shard in self.shards]
+
+    def _scan(self, func, batch_size):
+        # Chains func(shard) of the shards of every group into one
+        # stream, and fetches the next batch of all streams at once.
+        batch_size = batch_size or self.container_class.BATCH_SIZE
+        streams = [chain.from_iterable(func(shard) for shard in group)
+                   for group in self._groups]
+        while streams:
+            futures = [(stream, self._executor.submit(
+                lambda stream: list(islice(stream, batch_size)), stream))
+                for stream in streams]
+            streams = []
+            for stream, future in futures:
+                batch = future.result()
+                if batch:
+                    streams.append(stream)
+                    yield from batch
+
+    def __len__(self):
+        return sum(self._map(len))
+
+    def flush(self):
+        self._map(lambda shard: shard.flush())
+
+    def clear(self):
+        self._map(lambda shard: shard.clear())
+
+    def delete(self):
+        self._map(lambda shard: shard.delete())
+
+    def close(self):
+        # Shards sharing an adapter flush before its owner closes it.
+        self._map(lambda shard: None if shard._close_adapter
+                  else shard.close())
+        self._map(lambda shard: shard.close() if shard._close_adapter
+                  else None)
+        self._executor.shutdown(wait=True)
+
+
+class ShardedBigDict(ShardedContainer):
+    container_class = BigDict
+
+    def _shard(self, key):
+        return super()._shard(str(key))
+
+    def __getitem__(self, key):
+        return self._shard(key)[key]
+
+    def __setitem__(self, key, value):
+        self._shard(key)[key] = value
+
+    def __delitem__(self, key):
+        del self._shard(key)[key]
+
+    def __contains__(self, key):
+        return key in self._shard(key)
+
+    def get(self, key, default=None):
+        return self._shard(key).get(key, default)
+
+    def pop(self, key):
+        return self._shard(key).pop(key)
+
+    def popitem(self):
+        for shard in self.shards:
+            try:
+                return shard.popitem()
+            except KeyError:
+                pass
+        raise KeyError("popitem(): ShardedBigDict is empty")
+
+    def update(self, dic, chunk_size=None):
+        if not isinstance(dic, dict):
+            raise TypeError("Dict required.")
+        parts = {id(shard): {} for shard in self.shards}
+        for key, value in dic.items():
+            parts[id(self._shard(key))][key] = value
+        self._map(lambda shard: shard.update(parts[id(shard)], chunk_size))
+
+    def __iter__(self):
+        yield from self.keys()
+
+    def keys(self, batch_size=None):
+        for key, _ in self.items(batch_size):
+            yield key
+
+    def values(self, batch_size=None):
+        for _, value in self.items(batch_size):
+            yield value
+
+    def items(self, batch_size=None):
+        return self._scan(lambda shard: shard.items(batch_size), batch_size)
+
+
+class ShardedBigSet(ShardedContainer):
+    # Members are placed by canonical_hash(), so equal members meet on
+    # one shard whatever their type or serialized form. Set algebra is
+    # not supported across shards.
+    container_class = BigSet
+
+    def _shard(self, obj):
+        return super()._shard(canonical_hash(obj))
+
+    def add(self, obj):
+        self._shard(obj).add(obj)
+
+    def remove(self, obj):
+        self._shard(obj).remove(obj)
+
+    def __contains__(self, obj):
+        return obj in self._shard(obj)
+
+    def update(self, it, chunk_size=None):
+        if not hasattr(it, "__iter__"):
+            raise TypeError(f"{type(it)} is not iterable")
+        parts = {id(shard): [] for shard in self.shards}
+        for obj in it:
+            parts[id(self._shard(obj))].append(obj)
+        self._map(lambda shard: shard.update(parts[id(shard)], chunk_size))
+
+    def pop(self):
+        for shard in self.shards:
+            try:
+                return shard.pop()
+            except KeyError:
+                pass
+        raise KeyError("ShardedBigSet empty.")
+
+    def __iter__(self):
+        yield from self.members()
+
+    def members(self, batch_size=None):
+        return self._scan(lambda shard: shard.members(batch_size),
+                          batch_size)
+
+
+class ShardedBigQueue(ShardedContainer):
+    # Puts go round-robin over the shards. Every consumer thread gets a
+    # home shard it reads first and steals from the others when that is
+    # empty, so consumers rarely contend for the same table. The order
+    # is FIFO per shard only. `maxsize` applies to each shard.
+    container_class = BigQueue
+
+    def __init__(self, adapters=None, shards=None, name=None, replicas=100,
+                 poll_interval=0.01, **kwargs):
+        super().__init__(adapters, shards, name, replicas,
+                         poll_interval=poll_interval, **kwargs)
+        self.poll_interval = poll_interval
+        self._next_put = count()
+        self._next_home = count()
+        self._local = threading.local()
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.all_tasks_done = threading.Condition(self.mutex)
+        self.unfinished_tasks = 0
+
+    def _home(self):
+        home = getattr(self._local, "home", None)
+        if home is None:
+            home = self._local.home = \
+                next(self._next_home) % len(self.shards)
+        return home
+
+    def _steal_order(self):
+        home = self._home()
+        return self.shards[home:] + self.shards[:home]
+
+    def _wait(self, block, endtime):
+        # A put into another process's shard cannot notify us, so
+        # waiters also wake up every poll_interval.
+        if not block:
+            raise Empty
+        timeout = self.poll_interval
+        if endtime is not None:
+            remaining = endtime - time()
+            if remaining <= 0.0:
+                raise Empty
+            timeout = min(timeout, remaining)
+        with self.not_empty:
+            self.not_empty.wait(timeout)
+
+    def put(self, obj, block=True, timeout=None):
+        shard = self.shards[next(self._next_put) % len(self.shards)]
+        shard.put(obj, block, timeout)
+        with self.not_empty:
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def put_many(self, objs, block=True, timeout=None):
+        objs = list(objs)
+        start = next(self._next_put)
+        n = len(self.shards)
+        for i in range(n):
+            part = objs[i::n]
+            if part:
+                self.shards[(start + i) % n].put_many(part, block, timeout)
+                with self.not_empty:
+                    self.unfinished_tasks += len(part)
+                    self.not_empty.notify(len(part))
+
+    def get(self, block=True, timeout=None):
+        if block and timeout is not None and timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        endtime = None if timeout is None else time() + timeout
+        while True:
+            for shard in self._steal_order():
+                try:
+                    return shard.get(block=False)
+                except Empty:
+                    pass
+            self._wait(block, endtime)
+
+    def get_many(self, max_items, block=True, timeout=None):
+        if max_items < 1:
+            raise ValueError("'max_items' must be a positive number")
+        if block and timeout is not None and timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        endtime = None if timeout is None else time() + timeout
+        while True:
+            items = []
+            for shard in self._steal_order():
+                try:
+                    items.extend(shard.get_many(max_items - len(items),
+                                                block=False))
+                except Empty:
+                    pass
+                if len(items) >= max_items:
+                    break
+            if items:
+                return items
+            self._wait(block, endtime)
+
+    def put_nowait(self, obj):
+        self.put(obj, block=False)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return sum(self._map(lambda shard: shard.qsize()))
+
+    def empty(self):
+        return not self.qsize()
+
+    def full(self):
+        return all(self._map(lambda shard: shard.full()))
+
+    def task_done(self):
+        with self.all_tasks_done:
+            unfinished = self.unfinished_tasks - 1
+            if unfinished <= 0:
+                if unfinished < 0:
+                    raise ValueError('task_done() called too many times')
+                self.all_tasks_done.notify_all()
+            self.unfinished_tasks = unfinished
+
+    def join(self, timeout=None):
+        with self.all_tasks_done:
+            if timeout is None:
+                while self.unfinished_tasks:
+                    self.all_tasks_done.wait()
+            elif timeout < 0:
+                raise ValueError("'timeout' must be a non-negative number")
+            else:
+                endtime = time() + timeout
+                while self.unfinished_tasks:
+                    remaining = endtime - time()
+                    if remaining < 0.0:
+                        raise TimeoutError("wait task done timeout.")
+                    self.all_tasks_done.wait(remaining)
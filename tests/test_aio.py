@@ -0,0 +1,152 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import random
+from queue import Empty, Full
+from skua.adapter.sqlite import SQLiteDB
+from skua.aio import (AsyncBigDict,
+                      AsyncBigSet,
+                      AsyncBigQueue,
+                      AsyncBigPriorityQueue)
+
+_STR = "asbcdefhijklmnopqrstuvwxyz_"
+
+def random_str(k):
+    return "".join(random.choices(_STR, k=5))
+
+
+class Priority:
+
+    def __init__(self, data):
+        self.data = data
+        self.priority = random.randint(0, 20)
+
+
+class TestAsyncSQLite(unittest.IsolatedAsyncioTestCase):
+    def get_dict(self):
+        return AsyncBigDict()
+
+    def get_set(self):
+        return AsyncBigSet()
+
+    def get_queue(self, maxsize=0):
+        return AsyncBigQueue(maxsize=maxsize)
+
+    def get_priority_queue(self, maxsize=0):
+        return AsyncBigPriorityQueue(maxsize=maxsize)
+
+    async def test_dict(self):
+        bd = self.get_dict()
+        dic = {f"key_{k}": random_str(20) for k in range(50)}
+        for key, value in dic.items():
+            await bd.setitem(key, value)
+        self.assertEqual(await bd.len(), len(dic))
+        self.assertEqual(await bd.getitem("key_0"), dic["key_0"])
+        self.assertTrue(await bd.contains("key_1"))
+        self.assertIsNone(await bd.get("missing"))
+
+        items = {}
+        async for key, value in bd.items(batch_size=7):
+            items[key] = value
+        self.assertEqual(items, dic)
+        self.assertEqual(sorted([key async for key in bd]), sorted(dic))
+
+        self.assertEqual(await bd.pop("key_0"), dic["key_0"])
+        with self.assertRaises(KeyError):
+            await bd.getitem("key_0")
+        await bd.delete()
+        bd.close()
+
+    async def test_close(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "aio.db")
+            sqlite = SQLiteDB()
+            sqlite.connect(path)
+            bd = AsyncBigDict(sqlite, write_behind=True, bloom_capacity=100)
+            await bd.setitem("a", 1)
+            # Closes the container: buffer and Bloom filter are saved
+            # and the adapter is closed.
+            bd.close()
+            self.assertFalse(sqlite._connected)
+            sqlite = SQLiteDB()
+            sqlite.connect(path)
+            self.assertEqual(sqlite.count("skua_BigDict", {}), 1)
+            self.assertEqual(sqlite.count("skua_BigDict_bloom", {}), 1)
+            sqlite.close()
+
+    async def test_set(self):
+        bs = self.get_set()
+        members = {f"member_{k}" for k in range(50)}
+        await bs.update(members)
+        await bs.add("member_0")
+        self.assertEqual(await bs.len(), len(members))
+        self.assertEqual({member async for member in bs}, members)
+        await bs.remove("member_0")
+        self.assertFalse(await bs.contains("member_0"))
+        await bs.delete()
+        bs.close()
+
+    async def test_queue_put_get(self):
+        q = self.get_queue()
+        await q.clear()
+        count = random.randint(30, 50)
+        lst = [random_str(k) for k in range(count)]
+
+        async def consumer(n):
+            got = []
+            for _ in range(n):
+                got.append(await q.get())
+                q.task_done()
+            return got
+
+        consumers = [asyncio.create_task(consumer(count // 2)),
+                     asyncio.create_task(consumer(count - count // 2))]
+        await asyncio.sleep(0.05)
+        for string in lst[:10]:
+            await q.put(string)
+        await q.put_many(lst[10:])
+
+        got = await asyncio.gather(*consumers)
+        self.assertEqual(sorted(got[0] + got[1]), sorted(lst))
+        await asyncio.wait_for(q.join(), 1)
+        with self.assertRaises(Empty):
+            await q.get_nowait()
+        q.close()
+
+    async def test_queue_maxsize(self):
+        q = self.get_queue(maxsize=5)
+        await q.clear()
+        await q.put_many(range(5))
+        self.assertTrue(await q.full())
+        with self.assertRaises(Full):
+            await q.put_nowait(5)
+
+        put = asyncio.create_task(q.put(5))
+        await asyncio.sleep(0.05)
+        self.assertFalse(put.done())
+        self.assertEqual(await q.get_many(2), [0, 1])
+        await asyncio.wait_for(put, 1)
+        self.assertEqual(await q.qsize(), 4)
+
+        # put_many waits for room and fills it as it frees up.
+        put = asyncio.create_task(q.put_many([6, 7, 8]))
+        await asyncio.sleep(0.05)
+        self.assertEqual(await q.qsize(), 5)
+        self.assertEqual(await q.get_many(3), [2, 3, 4])
+        await asyncio.wait_for(put, 1)
+        self.assertEqual(await q.get_many(5), [5, 6, 7, 8])
+        self.assertTrue(await q.empty())
+        q.close()
+
+    async def test_priority_queue(self):
+        q = self.get_priority_queue()
+        await q.clear()
+        await q.put_many([Priority(k) for k in range(30)])
+        old = None
+        for _ in range(30):
+            obj = await q.get()
+            if old:
+                self.assertLessEqual(old.priority, obj.priority)
+            old = obj
+        q.close()
@@ -1,7 +1,14 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
 import unittest
 import random
+from operator import add
 from skua.adapter.mysql import MySQLDB
 from skua.adapter.mongo import MongoDB
+from skua.adapter.sqlite import SQLiteDB
 from skua.bigdict import BigDict
 
 TEST_DB = "skua_test"
@@ -11,6 +18,10 @@ def random_str(k):
     return "".join(random.choices(_STR, k=5))
 
 
+def double_value(key, value):
+    return value * 2
+
+
 class TestBigDictSQLite(unittest.TestCase):
     def get_bd(self):
         return BigDict()
@@ -218,6 +229,306 @@ class TestBigDictSQLite(unittest.TestCase):
         bd.delete()
 
 
+    def test_items_batch(self):
+        bd = self.get_bd()
+        dic = {}
+        length = random.randint(30, 50)
+        for k in range(length):
+            key = f"key_{k}"
+            value = random_str(20)
+            bd[key] = value
+            dic[key] = value
+
+        self.assertEqual(dict(bd.items(batch_size=7)), dic)
+        self.assertEqual(sorted(bd.keys(batch_size=1)), sorted(dic))
+        self.assertEqual(sorted(bd.values(batch_size=length)),
+                         sorted(dic.values()))
+        bd.delete()
+
+
+    def test_setitem_overwrite(self):
+        bd = self.get_bd()
+        length = random.randint(30, 50)
+        for _ in range(3):
+            for k in range(length):
+                value = random_str(20)
+                bd[f"key_{k}"] = value
+                self.assertEqual(bd[f"key_{k}"], value)
+
+        self.assertEqual(len(bd), length)
+        bd.delete()
+
+
+    def test_update_chunked(self):
+        bd = self.get_bd()
+        length = random.randint(30, 50)
+        dic = {f"key_{k}": random_str(20) for k in range(length)}
+        bd.update(dic, chunk_size=7)
+        dic = {key: random_str(20) for key in dic}
+        bd.update(dic, chunk_size=7)
+
+        self.assertEqual(len(bd), length)
+        for key, value in dic.items():
+            self.assertEqual(value, bd[key])
+
+        with self.assertRaises(TypeError):
+            bd.update([("key", "value")])
+        bd.delete()
+
+
+    def test_batch(self):
+        bd = self.get_bd()
+        bd.clear()
+        with bd.batch():
+            bd["a"] = 1
+            bd["b"] = 2
+        self.assertEqual(len(bd), 2)
+
+        with self.assertRaises(RuntimeError):
+            with bd.batch():
+                bd["c"] = 3
+                self.assertEqual(bd.pop("a"), 1)
+                raise RuntimeError
+        self.assertEqual(bd["a"], 1)
+        self.assertNotIn("c", bd)
+        with self.assertRaises(KeyError):
+            bd.pop("c")
+        bd.clear()
+
+
+    def test_serializer(self):
+        # The containers share one adapter, keep them all alive.
+        bd = self.get_bd()
+        bd.delete()
+        json_bd = BigDict(bd._adapter, serializer="json")
+        json_bd["a"] = {"list": [1, 2], "none": None}
+        self.assertEqual(json_bd["a"], {"list": [1, 2], "none": None})
+
+        # A container opened without a serializer follows the one
+        # recorded for the table, and a different one is refused.
+        other = BigDict(bd._adapter)
+        self.assertEqual(other._serializer.name, "json")
+        self.assertEqual(other["a"], {"list": [1, 2], "none": None})
+        with self.assertRaises(ValueError):
+            BigDict(bd._adapter, serializer="pickle")
+        other.delete()
+
+        raw_bd = BigDict(bd._adapter, serializer="raw")
+        raw_bd["b"] = b"\x00bytes"
+        self.assertEqual(raw_bd["b"], b"\x00bytes")
+        raw_bd.delete()
+
+    def test_compression(self):
+        bd = self.get_bd()
+        bd.delete()
+        zlib_bd = BigDict(bd._adapter, compression="zlib",
+                          compress_threshold=100)
+        zlib_bd["small"] = "x"
+        zlib_bd["large"] = "x" * 10000
+        zlib_bd.update({"many": ["y"] * 1000})
+        self.assertEqual(zlib_bd["small"], "x")
+        self.assertEqual(zlib_bd["large"], "x" * 10000)
+        self.assertEqual(zlib_bd["many"], ["y"] * 1000)
+
+        # Only values above the threshold are compressed.
+        rows = {row[zlib_bd.KEY]: row[zlib_bd.VALUE] for row in
+                bd._adapter.find_many(zlib_bd._table)}
+        self.assertEqual(rows["small"][:1], zlib_bd.PLAIN)
+        self.assertEqual(rows["large"][:1], zlib_bd.COMPRESSED)
+        self.assertLess(len(rows["large"]), 1000)
+
+        other = BigDict(bd._adapter)
+        self.assertEqual(other["large"], "x" * 10000)
+        with self.assertRaises(ValueError):
+            BigDict(bd._adapter, compression="lzma")
+        other.delete()
+
+
+    def test_cache(self):
+        bd = self.get_bd()
+        bd.clear()
+        cached = BigDict(bd._adapter, cache_size=10)
+        cached["a"] = [1]
+        self.assertEqual(cached["a"], [1])
+        self.assertIn("a", cached)
+        self.assertEqual(cached.cache_info.hits, 2)
+
+        # Reads are served from the cache, writes go through it.
+        bd["b"] = 2
+        self.assertEqual(cached["b"], 2)
+        self.assertEqual(cached.cache_info.misses, 1)
+        cached["b"] = 3
+        self.assertEqual(bd["b"], 3)
+        self.assertEqual(cached["b"], 3)
+        self.assertEqual(cached.pop("b"), 3)
+        self.assertNotIn("b", cached)
+        del cached["a"]
+        with self.assertRaises(KeyError):
+            cached["a"]
+
+        cached.update({"c": 1, "d": 2})
+        self.assertEqual(cached.cache_info.entries, 2)
+        cached.clear()
+        self.assertEqual(cached.cache_info.entries, 0)
+        self.assertIsNone(bd.cache_info)
+
+    def test_cache_rollback(self):
+        bd = self.get_bd()
+        bd.clear()
+        cached = BigDict(bd._adapter, cache_size=10)
+        cached["c"] = 1
+        with self.assertRaises(RuntimeError):
+            with cached.batch():
+                cached["c"] = 10
+                raise RuntimeError
+        self.assertEqual(cached["c"], 1)
+        cached.clear()
+
+
+    def test_write_behind(self):
+        bd = self.get_bd()
+        bd.clear()
+        # No timer by default, so any adapter will do.
+        wb = BigDict(bd._adapter, write_behind=True, flush_size=3)
+        wb["a"] = 1
+        wb["a"] = 2
+        wb["b"] = 1
+        del wb["b"]
+        # Coalesced in memory, visible to this object only.
+        self.assertEqual(wb["a"], 2)
+        self.assertNotIn("b", wb)
+        with self.assertRaises(KeyError):
+            wb["b"]
+        self.assertNotIn("a", bd)
+
+        wb["c"] = 3
+        self.assertEqual(bd["c"], 3)
+        self.assertEqual(bd["a"], 2)
+        self.assertNotIn("b", bd)
+
+        wb["d"] = 4
+        self.assertEqual(len(wb), 3)
+        self.assertEqual(bd["d"], 4)
+        wb["e"] = 5
+        del wb["a"]
+        self.assertEqual(sorted(wb.keys()), ["c", "d", "e"])
+        wb["f"] = 6
+        wb.flush()
+        self.assertEqual(bd["f"], 6)
+        wb.clear()
+        self.assertEqual(len(bd), 0)
+
+    def test_write_behind_interval(self):
+        bd = self.get_bd()
+        bd.clear()
+        wb = BigDict(bd._adapter, write_behind=True, flush_interval=0.05)
+        wb["a"] = 1
+        self.assertNotIn("a", bd)
+        time.sleep(0.3)
+        self.assertEqual(bd["a"], 1)
+
+        # The timer fires while another thread is inside a batch.
+        def writer():
+            wb["b"] = 2
+            time.sleep(0.05)
+            with wb.batch():
+                time.sleep(0.1)
+                wb["c"] = 3
+                self.assertEqual(wb["b"], 2)
+
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        wb.flush()
+        self.assertEqual((bd["b"], bd["c"]), (2, 3))
+        bd.clear()
+
+
+    def test_write_behind_close(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bigdict.db")
+            writer, reader = SQLiteDB(), SQLiteDB()
+            writer.connect(path)
+            reader.connect(path)
+            wb = BigDict(writer, write_behind=True, flush_interval=None)
+            wb["a"] = 1
+            bd = BigDict(reader)
+            self.assertNotIn("a", bd)
+            wb.close()
+            self.assertEqual(bd["a"], 1)
+
+
+    def test_bloom(self):
+        bd = self.get_bd()
+        bd.clear()
+        bd["existing"] = 0
+        bloom_bd = BigDict(bd._adapter, bloom_capacity=100)
+        bloom_bd["a"] = 1
+        bloom_bd.update({"b": 2})
+        self.assertIn("existing", bloom_bd)
+        self.assertEqual(bloom_bd["b"], 2)
+        self.assertNotIn("missing", bloom_bd)
+        self.assertIsNone(bloom_bd.get("missing"))
+        with self.assertRaises(KeyError):
+            bloom_bd["missing"]
+        bloom_bd.clear()
+
+        # Nothing is left to save after delete().
+        sqlite = SQLiteDB()
+        sqlite.connect()
+        bloom_bd = BigDict(sqlite, bloom_capacity=100)
+        bloom_bd["a"] = 1
+        bloom_bd.delete()
+        self.assertFalse(sqlite.table_exit("skua_BigDict_bloom"))
+        bloom_bd.close()
+
+
+    def test_map_reduce(self):
+        bd = self.get_bd()
+        bd.clear()
+        bd.update({f"key_{k}": k for k in range(250)})
+        del bd["key_100"]
+        expected = sum(k * 2 for k in range(250)) - 200
+        for executor in ["thread", "process"]:
+            self.assertEqual(bd.map_reduce(double_value, add, workers=3,
+                                           executor=executor,
+                                           partition_size=40), expected)
+        # Partitions keep table order.
+        self.assertEqual(bd.map_reduce(lambda key, value: [value], add,
+                                       partition_size=7),
+                         [k for k in range(250) if k != 100])
+        bd.clear()
+        self.assertEqual(bd.map_reduce(double_value, add, initial=0), 0)
+        with self.assertRaises(TypeError):
+            bd.map_reduce(double_value, add)
+        with self.assertRaises(ValueError):
+            bd.map_reduce(double_value, add, executor="fiber")
+
+
+    def test_legacy_duplicates(self):
+        # Before upserts, every assignment appended a row.
+        sqlite = SQLiteDB()
+        sqlite.connect()
+        sqlite.execute("CREATE TABLE skua_BigDict \
+            (_key VARCHAR(128), _value BLOB)")
+        sqlite.add_many("skua_BigDict", [
+            {"_key": key, "_value": pickle.dumps(value)}
+            for key, value in [("a", 1), ("b", 2), ("a", 3), ("a", 4)]])
+        # Unrecorded rows are pickles, no other codec may claim them.
+        with self.assertRaises(ValueError):
+            BigDict(sqlite, serializer="json")
+        with self.assertRaises(ValueError):
+            BigDict(sqlite, serializer="json")
+        bd = BigDict(sqlite)
+        self.assertEqual(bd._serializer.name, "pickle")
+        self.assertEqual(len(bd), 2)
+        self.assertEqual(bd["a"], 4)
+        bd["b"] = 5
+        self.assertEqual(dict(bd.items()), {"a": 4, "b": 5})
+        bd.close()
+
+
 class TestBigDictMySQL(TestBigDictSQLite):
     def get_bd(self):
         mysql = MySQLDB()
@@ -225,9 +536,27 @@ class TestBigDictMySQL(TestBigDictSQLite):
         mysql.select_db(TEST_DB)
         return BigDict(mysql)
 
+    @unittest.skip("An unpooled MySQLDB can not flush on a timer")
+    def test_write_behind_interval(self):
+        pass
+
 
 class TestBigDictMongo(TestBigDictSQLite):
     def get_bd(self):
         mongo = MongoDB()
         mongo.connect(db=TEST_DB)
         return BigDict(mongo)
+
+    def test_batch(self):
+        # MongoDB applies writes one by one, batch() does not roll back.
+        bd = self.get_bd()
+        bd.clear()
+        with bd.batch():
+            bd["a"] = 1
+            bd["b"] = 2
+        self.assertEqual(len(bd), 2)
+        bd.clear()
+
+    @unittest.skip("MongoDB batches do not roll back")
+    def test_cache_rollback(self):
+        pass
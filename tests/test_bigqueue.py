@@ -1,10 +1,15 @@
+import os
+import pickle
 import unittest
 import random
+import tempfile
 import threading
 from queue import Full, Empty
 from skua.bigqueue import BigQueue, BigPriorityQueue
+from skua.adapter.sqlite import SQLiteDB
 from skua.adapter.mysql import MySQLDB
 from skua.adapter.mongo import MongoDB
+from skua.container import stable_hash
 
 TEST_DB = "skua_test"
 _STR = "asbcdefhijklmnopqrstuvwxyz_"
@@ -46,6 +51,8 @@ class TestBigQueueSQLite(unittest.TestCase):
         
         for _ in range(count):
             self.assertTrue(q.get(block=False) in lst)
+        # map_reduce() is only for BigDict and BigSet.
+        self.assertFalse(hasattr(q, "map_reduce"))
 
     def test_qsize(self):
         q = self.get_queue()
@@ -234,6 +241,242 @@ class TestBigQueueSQLite(unittest.TestCase):
             obj = q.get()
             self.assertIsNotNone(obj)
 
+    def test_put_many_get_many(self):
+        q = self.get_queue()
+        count = random.randint(30, 50)
+        lst = [random_str(k) for k in range(count)]
+        q.put_many(lst)
+        self.assertEqual(q.qsize(), count)
+
+        got = []
+        while len(got) < count:
+            items = q.get_many(7, block=False)
+            self.assertLessEqual(len(items), 7)
+            self.assertGreater(len(items), 0)
+            got.extend(items)
+            for _ in items:
+                q.task_done()
+        self.assertEqual(sorted(got), sorted(lst))
+        q.join(timeout=1)
+
+        with self.assertRaises(Empty):
+            q.get_many(7, timeout=0.1)
+        with self.assertRaises(ValueError):
+            q.get_many(0)
+
+    def test_put_many_full(self):
+        count = random.randint(30, 50)
+        q = self.get_queue(count)
+        with self.assertRaises(Full):
+            q.put_many([random_str(k) for k in range(count + 5)],
+                       timeout=0.1)
+        self.assertEqual(q.qsize(), count)
+        self.assertEqual(len(q.get_many(count + 5)), count)
+
+    def test_priority_put_many_get_many(self):
+        q = self.get_priority_queue()
+        count = random.randint(30, 50)
+        q.put_many([PriorityV(random_str(k)) for k in range(count)])
+
+        old = None
+        for _ in range(0, count, 10):
+            for obj in q.get_many(10, block=False):
+                if old:
+                    self.assertLessEqual(old.priority, obj.priority)
+                old = obj
+        self.assertTrue(q.empty())
+
+
+    def test_fifo(self):
+        q = self.get_queue()
+        count = random.randint(30, 50)
+        lst = [random_str(k) for k in range(count)]
+        # Duplicated payloads must come out once per put.
+        lst[1] = lst[0]
+        for string in lst[:10]:
+            q.put(string)
+        q.put_many(lst[10:])
+
+        self.assertEqual(q.get_nowait(), lst[0])
+        self.assertEqual(q.get_nowait(), lst[1])
+        self.assertEqual(q.get_many(8), lst[2:10])
+        self.assertEqual([q.get_nowait() for _ in range(count - 10)],
+                         lst[10:])
+        self.assertTrue(q.empty())
+
+
+    def test_priority_stable(self):
+        q = self.get_priority_queue()
+        count = random.randint(30, 50)
+        lst = []
+        for k in range(count):
+            obj = PriorityV(k)
+            obj.priority = k % 3
+            lst.append(obj)
+        q.put_many(lst[:10])
+        for obj in lst[10:]:
+            q.put(obj)
+
+        expected = sorted(lst, key=lambda obj: obj.priority)
+        got = q.get_many(5) + [q.get_nowait() for _ in range(count - 5)]
+        self.assertEqual([obj.data for obj in got],
+                         [obj.data for obj in expected])
+
+
+    def get_shared_queue(self, path):
+        sqlite = SQLiteDB()
+        sqlite.connect(path)
+        return BigQueue(sqlite, shared=True, poll_interval=0.01)
+
+    def test_refresh_size(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "queue.db")
+            sqlite = SQLiteDB()
+            sqlite.connect(path)
+            q = BigQueue(sqlite)
+            count = random.randint(30, 50)
+            for k in range(count):
+                q.put(random_str(k))
+            self.assertEqual(q.qsize(), count)
+
+            # Rows written behind the queue's back by another process.
+            other = self.get_shared_queue(path)
+            other.put_many([random_str(k) for k in range(count)])
+            self.assertEqual(q.qsize(), count)
+            self.assertEqual(q.refresh_size(), count * 2)
+            self.assertEqual(q.qsize(), count * 2)
+
+            q.clear()
+            self.assertEqual(q.qsize(), 0)
+            self.assertTrue(q.empty())
+
+    def test_shared_consumers(self):
+        # Every consumer has its own connection, like separate processes.
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "queue.db")
+            producer = self.get_shared_queue(path)
+            count = 200
+            results = []
+
+            def consumer():
+                q = self.get_shared_queue(path)
+                got = []
+                try:
+                    while True:
+                        got.extend(q.get_many(random.randint(1, 5),
+                                              timeout=0.5))
+                        got.append(q.get(timeout=0.5))
+                except Empty:
+                    results.append(got)
+
+            consumer_threads = []
+            for _ in range(4):
+                t = threading.Thread(target=consumer)
+                t.start()
+                consumer_threads.append(t)
+
+            for k in range(count):
+                producer.put(k)
+            for t in consumer_threads:
+                t.join()
+
+            got = [k for part in results for k in part]
+            self.assertEqual(sorted(got), list(range(count)))
+            self.assertEqual(producer.qsize(), 0)
+
+
+    def get_lease_queue(self, visibility_timeout):
+        q = BigQueue(name="skua_BigLeaseQueue",
+                     visibility_timeout=visibility_timeout,
+                     poll_interval=0.01)
+        q.clear()
+        return q
+
+    def test_lease_ack(self):
+        q = self.get_lease_queue(0.3)
+        q.put_many(["a", "b", "c"])
+
+        handle_a, item = q.get_lease()
+        self.assertEqual(item, "a")
+        handle_b, item = q.get_lease()
+        self.assertEqual(item, "b")
+        self.assertEqual(q.qsize(), 1)
+        # get() never returns a leased item.
+        self.assertEqual(q.get_nowait(), "c")
+        with self.assertRaises(Empty):
+            q.get_lease(block=False)
+
+        q.ack(handle_a)
+        q.task_done()
+        # The unacked lease expires and "b" becomes visible again.
+        handle, item = q.get_lease(timeout=2)
+        self.assertEqual(item, "b")
+        # The stale handle no longer matches the new lease.
+        q.ack(handle_b)
+        self.assertEqual(len(q), 1)
+        q.task_done(handle)
+        self.assertEqual(len(q), 0)
+
+    def test_lease_type_checker(self):
+        with self.assertRaises(ValueError):
+            self.get_lease_queue(0)
+        with self.assertRaises(RuntimeError):
+            self.get_queue().get_lease()
+
+
+    def test_shared_backoff(self):
+        with self.assertRaises(ValueError):
+            BigQueue(shared=True, poll_interval=0.5, poll_max=0.1)
+
+        q = BigQueue(shared=True, poll_interval=0.01, poll_max=0.08)
+        q.clear()
+        with self.assertRaises(Empty):
+            q.get(timeout=0.5)
+        self.assertEqual(q._poll_delay, 0.08)
+
+        # A put from another thread of the process wakes the waiter at
+        # once and resets the backoff.
+        timer = threading.Timer(0.2, q.put, args=("item",))
+        timer.start()
+        self.assertEqual(q.get(timeout=5), "item")
+        self.assertEqual(q._poll_delay, 0.01)
+        timer.join()
+
+
+    def test_compression(self):
+        first = self.get_queue()
+        first.delete()
+        queue = BigQueue(first._adapter, compression="lzma",
+                         compress_threshold=0)
+        queue.put_many([b"z" * 5000, "small"])
+        self.assertEqual(queue.get(), b"z" * 5000)
+        self.assertEqual(queue.get(), "small")
+        queue.delete()
+
+
+    def test_stable_hash(self):
+        queue = self.get_queue()
+        queue.put("spam")
+        row = queue._adapter.find_one(queue._table, {})
+        self.assertEqual(row["_hash"], stable_hash(queue._dumps("spam")))
+        self.assertEqual(queue.get(), "spam")
+        queue.delete()
+
+
+    def test_legacy_table(self):
+        sqlite = SQLiteDB()
+        sqlite.connect()
+        sqlite.execute("CREATE TABLE skua_BigQueue \
+            (_object BLOB, _hash VARCHAR(50))")
+        sqlite.add_many("skua_BigQueue", [
+            {"_object": pickle.dumps(k), "_hash": "0"} for k in range(3)])
+        queue = BigQueue(sqlite)
+        self.assertEqual(queue.qsize(), 3)
+        self.assertEqual(queue.get_many(2), [0, 1])
+        self.assertEqual(queue.get(), 2)
+        queue.close()
+
+
 class TestBigQueueMySQL(TestBigQueueSQLite):
     def get_queue(self, maxsize=0):
         mysql = MySQLDB()
@@ -1,8 +1,17 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 import random
+from operator import add
 from skua.adapter.mysql import MySQLDB
 from skua.adapter.mongo import MongoDB
+from skua.adapter.sqlite import SQLiteDB
 from skua.bigset import BigSet
+from skua.container import canonical_hash, stable_hash
 
 TEST_DB = "skua_test"
 _STR = "asbcdefhijklmnopqrstuvwxyz_"
@@ -11,6 +20,10 @@ def random_str(k):
     return "".join(random.choices(_STR, k=5))
 
 
+def square(obj):
+    return obj * obj
+
+
 class Test:
     def __hash__(self):
         return None
@@ -120,6 +133,291 @@ class TestBigSetSQLite(unittest.TestCase):
         bs.delete()
 
 
+    def test_members(self):
+        bs = self.get_bs()
+        count = random.randint(30, 50)
+        members = set()
+        for k in range(count):
+            string = f"member_{k}"
+            bs.add(string)
+            members.add(string)
+
+        self.assertEqual(set(bs.members(batch_size=7)), members)
+        self.assertEqual(len(list(bs.members(batch_size=1))), count)
+        bs.delete()
+
+
+    def test_update_chunked(self):
+        bs = self.get_bs()
+        count = random.randint(30, 50)
+        lis = [f"member_{k}" for k in range(count)]
+
+        bs.update(lis * 2, chunk_size=7)
+        bs.update(iter(lis), chunk_size=count)
+        self.assertEqual(len(bs), count)
+        for string in lis:
+            self.assertTrue(string in bs)
+        bs.delete()
+
+
+    def test_write_behind(self):
+        bs = self.get_bs()
+        bs.clear()
+        wb = BigSet(bs._adapter, write_behind=True, flush_size=3,
+                    flush_interval=None)
+        wb.add("a")
+        wb.add("b")
+        wb.remove("b")
+        self.assertIn("a", wb)
+        self.assertNotIn("b", wb)
+        self.assertNotIn("a", bs)
+
+        wb.add("c")
+        self.assertIn("a", bs)
+        self.assertIn("c", bs)
+        self.assertNotIn("b", bs)
+
+        wb.remove("a")
+        wb.add("d")
+        self.assertEqual(sorted(wb), ["c", "d"])
+        self.assertEqual(len(bs), 2)
+        wb.clear()
+
+
+    def test_bloom(self):
+        bs = self.get_bs()
+        bs.clear()
+        bs.add("existing")
+        bloom_bs = BigSet(bs._adapter, bloom_capacity=100)
+        # Built by scanning the table, then kept up to date.
+        self.assertIn("existing", bloom_bs)
+        bloom_bs.add("a")
+        bloom_bs.update(["b", "c"])
+        for obj in ["existing", "a", "b", "c"]:
+            self.assertIn(obj, bloom_bs)
+        self.assertNotIn("missing", bloom_bs)
+        self.assertGreater(bloom_bs.false_positive_rate, 0)
+        self.assertIsNone(bs.false_positive_rate)
+        bloom_bs.remove("a")
+        self.assertNotIn("a", bloom_bs)
+        bloom_bs.clear()
+        self.assertNotIn("b", bloom_bs)
+        bloom_bs.delete()
+
+    def test_bloom_saved(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bigset.db")
+
+            def open_set(**kwargs):
+                sqlite = SQLiteDB()
+                sqlite.connect(path)
+                return BigSet(sqlite, **kwargs)
+
+            bs = open_set(bloom_capacity=100)
+            bs.update(range(50))
+            bs.close()
+
+            # Loaded as saved, no scan.
+            bs = open_set(bloom_capacity=100)
+            self.assertTrue(bs._bloom_saved)
+            self.assertIn(49, bs)
+            self.assertNotIn(50, bs)
+            bs.close()
+
+            # Rows added without the filter are caught by the row count.
+            bs = open_set()
+            bs.add(50)
+            bs.close()
+            bs = open_set(bloom_capacity=100)
+            self.assertFalse(bs._bloom_saved)
+            self.assertIn(50, bs)
+            bs.add(51)
+            self.assertIsNone(bs._meta_get("bloom"))
+            bs.close()
+
+
+    def test_set_algebra(self):
+        a = self.get_bs()
+        a.clear()
+        a.update(range(10))
+        b = BigSet(a._adapter, name="skua_test_other")
+        b.clear()
+        b.update(range(5, 15))
+
+        union = a | b
+        self.assertEqual(sorted(union), list(range(15)))
+        intersection = a & b
+        self.assertEqual(sorted(intersection), list(range(5, 10)))
+        difference = a.difference(b, [0, 1], name="skua_test_difference")
+        self.assertEqual(sorted(difference), [2, 3, 4])
+        self.assertEqual(difference._table, "skua_test_difference")
+
+        self.assertTrue(intersection.issubset(a))
+        self.assertTrue(intersection <= b)
+        self.assertTrue(intersection < b)
+        self.assertFalse(a <= b)
+        self.assertTrue(union >= a)
+        self.assertTrue(union > b)
+        self.assertTrue(difference.isdisjoint(b))
+        self.assertFalse(a.isdisjoint(b))
+        self.assertTrue(a.issuperset([1, 2, 3]))
+
+        self.assertEqual(sorted(a.iter_intersection(b)), list(range(5, 10)))
+        self.assertEqual(sorted(a.iter_difference([0, 1, 2, 3])),
+                         list(range(4, 10)))
+
+        a -= b
+        self.assertEqual(sorted(a), [0, 1, 2, 3, 4])
+        a |= [20, 21]
+        self.assertEqual(sorted(a), [0, 1, 2, 3, 4, 20, 21])
+        a &= union
+        self.assertEqual(sorted(a), [0, 1, 2, 3, 4])
+        a.difference_update([0], [1])
+        self.assertEqual(sorted(a), [2, 3, 4])
+
+        # Proper subsets of plain iterables count distinct members.
+        self.assertTrue(a < iter([2, 3, 4, 5]))
+        self.assertFalse(a < [2, 3, 4, 4])
+        self.assertTrue(a > [3, 3, 4])
+        self.assertFalse(a > iter([2, 3, 4]))
+
+        # Unnamed results are dropped with the object, named ones stay.
+        for bs in [union, intersection, b]:
+            bs.delete()
+        temporary = (a | [5])._table
+        self.assertFalse(a._adapter.table_exit(temporary))
+        result = a & [3]
+        self.assertTrue(a._adapter.table_exit(result._table))
+        result.close()
+        self.assertFalse(a._adapter.table_exit(result._table))
+        self.assertTrue(a._adapter.table_exit("skua_test_difference"))
+        difference.close()
+        self.assertTrue(a._adapter.table_exit("skua_test_difference"))
+        difference = BigSet(a._adapter, name="skua_test_difference")
+        difference.delete()
+        a.clear()
+
+
+    def test_stable_hash(self):
+        bs = self.get_bs()
+        bs.clear()
+        bs.update(["spam", "eggs", 42])
+        self.assertEqual(bs._hash_scheme, "canonical")
+        self.assertEqual(bs._get_hash("spam"), canonical_hash("spam"))
+        self.assertIn("spam", bs)
+        self.assertNotIn("ham", bs)
+        with self.assertRaises(ValueError):
+            BigSet(bs._adapter, hash_scheme="python")
+        # Members compare like Python objects, not like their pickles.
+        spam = "".join(["sp", "am"])
+        bs.add(("spam", "spam"))
+        self.assertIn(("spam", spam), bs)
+        self.assertIn(42.0, bs)
+        bs.add(1)
+        self.assertIn(1.0, bs)
+        self.assertIn(True, bs)
+        bs.add(1.0)
+        bs.add(frozenset(["a", "b", "c"]))
+        self.assertIn(frozenset(["c", "b", "a"]), bs)
+        self.assertEqual(len(bs), 6)
+        bs.clear()
+
+        # Opting in to digests of the serialized bytes.
+        sqlite = SQLiteDB()
+        sqlite.connect()
+        bs = BigSet(sqlite, hash_scheme="blake2b")
+        bs.add(1)
+        self.assertEqual(bs._get_hash(1), stable_hash(bs._serializer.dumps(1)))
+        self.assertIn(1, bs)
+        self.assertNotIn(1.0, bs)
+        with self.assertRaises(ValueError):
+            BigSet(sqlite, hash_scheme="canonical")
+        bs.close()
+
+    def test_stable_hash_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bigset.db")
+            script = ("import sys; from skua.adapter.sqlite import SQLiteDB;"
+                      "from skua.bigset import BigSet; sqlite = SQLiteDB();"
+                      "sqlite.connect(sys.argv[1]); bs = BigSet(sqlite);"
+                      "bs.add('spam'); bs.add(frozenset(['a', 'b', 'c']));"
+                      "print('spam' in bs, 'ham' in bs,"
+                      "frozenset('cba') in bs);"
+                      "bs.close()")
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            for seed in ["1", "2"]:
+                env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=root)
+                output = subprocess.check_output(
+                    [sys.executable, "-c", script, path], env=env)
+                self.assertEqual(output.split(), [b"True", b"False", b"True"])
+            sqlite = SQLiteDB()
+            sqlite.connect(path)
+            bs = BigSet(sqlite)
+            self.assertEqual(len(bs), 2)
+            bs.close()
+
+    def test_legacy_hash(self):
+        sqlite = SQLiteDB()
+        sqlite.connect()
+        sqlite.create_table("skua_BigSet", {"_hash": "VARCHAR(50)",
+                                            "_object": sqlite.blob})
+        bs = BigSet(sqlite)
+        self.assertEqual(bs._hash_scheme, "python")
+        bs.add("spam")
+        self.assertEqual(bs._get_hash("spam"), str(hash("spam")))
+        self.assertIn("spam", bs)
+        bs.close()
+
+
+    def test_map_reduce(self):
+        bs = self.get_bs()
+        bs.clear()
+        bs.update(range(100))
+        for executor in ["thread", "process"]:
+            self.assertEqual(bs.map_reduce(square, add, executor=executor,
+                                           workers=2, partition_size=30),
+                             sum(k * k for k in range(100)))
+
+        # One fetch at a time without concurrent reads.
+        adapter = bs._adapter
+        find_range = adapter.find_range
+        active, seen = [0], []
+        lock = threading.Lock()
+
+        def tracked(*args):
+            with lock:
+                active[0] += 1
+                seen.append(active[0])
+            try:
+                time.sleep(0.01)
+                return find_range(*args)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        adapter.find_range = tracked
+        try:
+            self.assertEqual(bs.map_reduce(square, add, workers=4,
+                                           partition_size=10),
+                             sum(k * k for k in range(100)))
+        finally:
+            del adapter.find_range
+        if not adapter.concurrent_reads:
+            self.assertEqual(max(seen), 1)
+        bs.clear()
+
+    def test_map_reduce_readers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sqlite = SQLiteDB()
+            sqlite.connect(os.path.join(tmp, "bigset.db"), readers=4,
+                           journal_mode="WAL")
+            bs = BigSet(sqlite, compression="zlib", compress_threshold=0)
+            bs.update(f"member_{k}" for k in range(500))
+            self.assertEqual(bs.map_reduce(len, max, workers=4,
+                                           partition_size=50), 10)
+            bs.close()
+
+
 class TestBigSetMySQL(TestBigSetSQLite):
     def get_bd(self):
         mysql = MySQLDB()
@@ -0,0 +1,34 @@
+import unittest
+from skua.bloom import BloomFilter
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_membership(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"key-{i}")
+        for i in range(1000):
+            self.assertIn(f"key-{i}", bloom)
+        misses = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(misses, 300)
+        self.assertAlmostEqual(bloom.false_positive_rate, 0.01, delta=0.005)
+
+    def test_bytes(self):
+        bloom = BloomFilter(100)
+        bloom.add("a")
+        loaded = BloomFilter.from_bytes(bloom.to_bytes())
+        self.assertIn("a", loaded)
+        self.assertNotIn("b", loaded)
+        self.assertEqual((loaded.nbits, loaded.nhashes, loaded.count),
+                         (bloom.nbits, bloom.nhashes, 1))
+
+    def test_clear(self):
+        bloom = BloomFilter(100)
+        bloom.add("a")
+        bloom.clear()
+        self.assertNotIn("a", bloom)
+        self.assertEqual(bloom.false_positive_rate, 0)
+        with self.assertRaises(ValueError):
+            BloomFilter(0)
+        with self.assertRaises(ValueError):
+            BloomFilter(10, 1.5)
@@ -0,0 +1,50 @@
+import time
+import unittest
+from skua.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_entries(self):
+        cache = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), (True, 1))
+        cache.put("c", 3)
+        # "b" was the least recently used.
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.get("c"), (True, 3))
+        info = cache.info()
+        self.assertEqual((info.hits, info.misses, info.entries), (2, 1, 2))
+
+    def test_bytes(self):
+        cache = LRUCache(max_bytes=10)
+        cache.put("a", "a", 4)
+        cache.put("b", "b", 4)
+        cache.put("c", "c", 4)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.info().nbytes, 8)
+        self.assertFalse(cache.get("a")[0])
+        cache.put("b", "big", 11)
+        self.assertFalse(cache.get("b")[0])
+        self.assertEqual(cache.info().nbytes, 4)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.05)
+        cache.put("a", 1)
+        self.assertTrue(cache.get("a")[0])
+        time.sleep(0.1)
+        self.assertFalse(cache.get("a")[0])
+        self.assertEqual(len(cache), 0)
+
+    def test_pop_clear(self):
+        cache = LRUCache(max_entries=10)
+        cache.put("a", 1, 3)
+        cache.put("b", 2, 3)
+        cache.pop("a")
+        cache.pop("missing")
+        self.assertFalse(cache.get("a")[0])
+        self.assertEqual(cache.info().nbytes, 3)
+        cache.clear()
+        self.assertEqual(cache.info().entries, 0)
+        with self.assertRaises(ValueError):
+            LRUCache(max_entries=0)
@@ -0,0 +1,25 @@
+import unittest
+from skua.compression import (ZlibCompressor,
+                              LZMACompressor,
+                              Compressor,
+                              get_compressor)
+
+
+class TestCompression(unittest.TestCase):
+    def test_codecs(self):
+        data = b"skua" * 1000
+        for compressor in [ZlibCompressor(), ZlibCompressor(level=1),
+                           LZMACompressor()]:
+            compressed = compressor.compress(data)
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(compressor.decompress(compressed), data)
+
+    def test_get_compressor(self):
+        self.assertIsNone(get_compressor())
+        self.assertIsNone(get_compressor("none"))
+        self.assertIsInstance(get_compressor("zlib"), ZlibCompressor)
+        self.assertIsInstance(get_compressor("lzma"), LZMACompressor)
+        compressor = Compressor()
+        self.assertIs(get_compressor(compressor), compressor)
+        with self.assertRaises(ValueError):
+            get_compressor("snappy")
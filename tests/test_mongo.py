@@ -284,4 +284,148 @@ class TestMongoDB(unittest.TestCase):
                 user = mongo.find_one(table, [], orderby="age")
 
         mongo.delete_table(table)
-        mongo.close()
\ No newline at end of file
+        mongo.close()
+
+    def test_find_iter(self):
+        mongo = self.new_db()
+        table = "test_find_iter"
+        count = 55
+        users = []
+        for _ in range(count):
+            users.append({"name": random_str(5),
+                          "age": random.randint(0, 100)})
+        mongo.add_many(table, users)
+
+        users = list(mongo.find_iter(table, {}, batch_size=7))
+        self.assertEqual(len(users), count)
+        ids = [user[mongo.ID] for user in users]
+        self.assertEqual(ids, sorted(set(ids)))
+
+        where = {"age": mongo.gt(50)}
+        users = list(mongo.find_iter(table, where, batch_size=3))
+        self.assertEqual(len(users), mongo.count(table, where))
+        for user in users:
+            self.assertGreater(user["age"], 50)
+
+        with self.assertRaises(ValueError):
+            list(mongo.find_iter(table, {}, batch_size=0))
+
+        mongo.delete_table(table)
+        mongo.close()
+
+    def test_upsert(self):
+        mongo = self.new_db()
+        table = "test_upsert"
+        count = 50
+        mongo.create_index(table, ["name"], unique=True)
+        self.assertTrue(mongo.index_exist(table, ["name"]))
+
+        users = {}
+        for k in range(count):
+            name = f"user_{k}"
+            users[name] = random.randint(0, 100)
+            mongo.upsert(table, {"name": name, "age": users[name]}, "name")
+
+        for name in users:
+            users[name] = random.randint(101, 200)
+            mongo.upsert(table, {"name": name, "age": users[name]}, ["name"])
+
+        self.assertEqual(mongo.count(table, {}), count)
+        for name, age in users.items():
+            user = mongo.find_one(table, {"name": name})
+            self.assertEqual(user["age"], age)
+
+        mongo.delete_table(table)
+        mongo.close()
+
+    def test_add_ignore(self):
+        mongo = self.new_db()
+        table = "test_add_ignore"
+        count = 50
+        mongo.create_index(table, ["name"], unique=True)
+
+        for k in range(count):
+            user = {"name": f"user_{k}", "age": k}
+            mongo.add_ignore(table, user)
+            mongo.add_ignore(table, {"name": f"user_{k}", "age": -1})
+
+        self.assertEqual(mongo.count(table, {}), count)
+        self.assertEqual(mongo.count(table, {"age": -1}), 0)
+
+        mongo.delete_table(table)
+        mongo.close()
+
+    def test_add_many_ignore_upsert_many(self):
+        mongo = self.new_db()
+        table = "test_add_many_ignore"
+        count = 50
+        mongo.create_index(table, ["name"], unique=True)
+
+        users = [{"name": f"user_{k % 20}", "age": k} for k in range(count)]
+        mongo.add_many_ignore(table, users)
+        self.assertEqual(mongo.count(table, {}), 20)
+        self.assertEqual(mongo.count(table, {"age": mongo.ge(20)}), 0)
+
+        users = [{"name": f"user_{k}", "age": k} for k in range(count)]
+        mongo.upsert_many(table, users, ["name"])
+        self.assertEqual(mongo.count(table, {}), count)
+        for k in range(count):
+            user = mongo.find_one(table, {"name": f"user_{k}"})
+            self.assertEqual(user["age"], k)
+
+        mongo.add_many_ignore(table, [])
+        mongo.upsert_many(table, [], ["name"])
+        with self.assertRaises(TypeError):
+            mongo.upsert_many(table, {}, ["name"])
+
+        mongo.delete_table(table)
+        mongo.close()
+
+    def test_pop_one_pop_many(self):
+        mongo = self.new_db()
+        table = "test_pop"
+        count = 50
+        users = [{"name": f"user_{k}", "age": random.randint(0, 10)}
+                 for k in range(count)]
+        mongo.add_many(table, users)
+
+        user = mongo.pop_one(table, {}, orderby=mongo.ID)
+        self.assertEqual(user["name"], "user_0")
+        self.assertEqual(mongo.count(table, {}), count - 1)
+
+        popped = mongo.pop_many(table, {"age": mongo.le(5)},
+                                orderby=["age", mongo.ID], limit=10)
+        self.assertLessEqual(len(popped), 10)
+        self.assertEqual(mongo.count(table, {}), count - 1 - len(popped))
+        keys = [(user["age"], user[mongo.ID]) for user in popped]
+        self.assertEqual(keys, sorted(keys))
+        for user in popped:
+            self.assertLessEqual(user["age"], 5)
+            self.assertIsNone(mongo.find_one(table, {"name": user["name"]}))
+
+        popped = mongo.pop_many(table, {}, orderby=mongo.ID, limit=count)
+        self.assertEqual(len(popped), count - 1 - len(keys))
+        self.assertIsNone(mongo.pop_one(table, {}, orderby=mongo.ID))
+        self.assertEqual(mongo.pop_many(table, {}, limit=5), [])
+
+        mongo.delete_table(table)
+        mongo.close()
+
+    def test_claim_one(self):
+        mongo = self.new_db()
+        table = "test_claim_one"
+        count = 20
+        mongo.add_many(table, [{"name": f"user_{k}", "age": 0}
+                               for k in range(count)])
+
+        for k in range(count):
+            user = mongo.claim_one(table, {"age": 0}, {"age": 1},
+                                   orderby=mongo.ID)
+            self.assertEqual(user["name"], f"user_{k}")
+            user = mongo.find_one(table, {"name": f"user_{k}"})
+            self.assertEqual(user["age"], 1)
+        self.assertIsNone(mongo.claim_one(table, {"age": 0}, {"age": 1}))
+        self.assertEqual(mongo.count(table, {"age": 1}), count)
+
+        mongo.delete_table(table)
+        mongo.close()
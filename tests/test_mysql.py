@@ -335,3 +335,207 @@ class TestMySQL(unittest.TestCase):
         mysql.delete_table(table)
         mysql.close()
 
+    def test_find_iter(self):
+        mysql = self.new_db()
+        table = "test_find_iter"
+        count = 55
+        mysql.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        users = []
+        for _ in range(count):
+            users.append({"name": random_str(5),
+                          "age": random.randint(0, 100)})
+        mysql.add_many(table, users)
+
+        users = list(mysql.find_iter(table, {}, batch_size=7))
+        self.assertEqual(len(users), count)
+        ids = [user[mysql.ID] for user in users]
+        self.assertEqual(ids, sorted(set(ids)))
+
+        where = {"age": mysql.gt(50)}
+        users = list(mysql.find_iter(table, where, batch_size=3))
+        self.assertEqual(len(users), mysql.count(table, where))
+        for user in users:
+            self.assertGreater(user["age"], 50)
+
+        with self.assertRaises(ValueError):
+            list(mysql.find_iter(table, {}, batch_size=0))
+
+        mysql.delete_table(table)
+        mysql.close()
+
+    def test_create_index(self):
+        mysql = self.new_db()
+        table = "test_create_index"
+        mysql.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        self.assertFalse(mysql.index_exist(table, ["name"]))
+        mysql.create_index(table, ["name"], unique=True)
+        self.assertTrue(mysql.index_exist(table, ["name"]))
+        with self.assertRaises(DatabaseWarning):
+            mysql.create_index(table, ["name"], unique=True)
+
+        mysql.delete_table(table)
+        mysql.close()
+
+    def test_upsert(self):
+        mysql = self.new_db()
+        table = "test_upsert"
+        count = 50
+        mysql.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        mysql.create_index(table, ["name"], unique=True)
+
+        users = {}
+        for k in range(count):
+            name = f"user_{k}"
+            users[name] = random.randint(0, 100)
+            mysql.upsert(table, {"name": name, "age": users[name]}, "name")
+
+        for name in users:
+            users[name] = random.randint(101, 200)
+            mysql.upsert(table, {"name": name, "age": users[name]}, ["name"])
+
+        self.assertEqual(mysql.count(table, {}), count)
+        for name, age in users.items():
+            user = mysql.find_one(table, {"name": name})
+            self.assertEqual(user["age"], age)
+
+        mysql.upsert(table, {"name": "user_0"}, ["name"])
+        self.assertEqual(mysql.count(table, {}), count)
+
+        mysql.delete_table(table)
+        mysql.close()
+
+    def test_add_ignore(self):
+        mysql = self.new_db()
+        table = "test_add_ignore"
+        count = 50
+        mysql.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        mysql.create_index(table, ["name"], unique=True)
+
+        for k in range(count):
+            user = {"name": f"user_{k}", "age": k}
+            mysql.add_ignore(table, user)
+            mysql.add_ignore(table, {"name": f"user_{k}", "age": -1})
+
+        self.assertEqual(mysql.count(table, {}), count)
+        self.assertEqual(mysql.count(table, {"age": -1}), 0)
+
+        mysql.delete_table(table)
+        mysql.close()
+
+    def test_add_many_ignore_upsert_many(self):
+        mysql = self.new_db()
+        table = "test_add_many_ignore"
+        count = 50
+        mysql.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        mysql.create_index(table, ["name"], unique=True)
+
+        users = [{"name": f"user_{k % 20}", "age": k} for k in range(count)]
+        mysql.add_many_ignore(table, users)
+        self.assertEqual(mysql.count(table, {}), 20)
+        self.assertEqual(mysql.count(table, {"age": mysql.ge(20)}), 0)
+
+        users = [{"name": f"user_{k}", "age": k} for k in range(count)]
+        mysql.upsert_many(table, users, ["name"])
+        self.assertEqual(mysql.count(table, {}), count)
+        for k in range(count):
+            user = mysql.find_one(table, {"name": f"user_{k}"})
+            self.assertEqual(user["age"], k)
+
+        mysql.add_many_ignore(table, [])
+        mysql.upsert_many(table, [], ["name"])
+        with self.assertRaises(TypeError):
+            mysql.upsert_many(table, {}, ["name"])
+
+        mysql.delete_table(table)
+        mysql.close()
+
+    def test_pop_one_pop_many(self):
+        mysql = self.new_db()
+        table = "test_pop"
+        count = 50
+        mysql.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        users = [{"name": f"user_{k}", "age": random.randint(0, 10)}
+                 for k in range(count)]
+        mysql.add_many(table, users)
+
+        user = mysql.pop_one(table, {}, orderby=mysql.ID)
+        self.assertEqual(user["name"], "user_0")
+        self.assertEqual(mysql.count(table, {}), count - 1)
+
+        popped = mysql.pop_many(table, {"age": mysql.le(5)},
+                                orderby=["age", mysql.ID], limit=10)
+        self.assertLessEqual(len(popped), 10)
+        self.assertEqual(mysql.count(table, {}), count - 1 - len(popped))
+        keys = [(user["age"], user[mysql.ID]) for user in popped]
+        self.assertEqual(keys, sorted(keys))
+        for user in popped:
+            self.assertLessEqual(user["age"], 5)
+            self.assertIsNone(mysql.find_one(table, {"name": user["name"]}))
+
+        popped = mysql.pop_many(table, {}, orderby=mysql.ID, limit=count)
+        self.assertEqual(len(popped), count - 1 - len(keys))
+        self.assertIsNone(mysql.pop_one(table, {}, orderby=mysql.ID))
+        self.assertEqual(mysql.pop_many(table, {}, limit=5), [])
+
+        mysql.delete_table(table)
+        mysql.close()
+
+    def test_claim_one(self):
+        mysql = self.new_db()
+        table = "test_claim_one"
+        count = 20
+        mysql.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        mysql.add_many(table, [{"name": f"user_{k}", "age": 0}
+                               for k in range(count)])
+
+        for k in range(count):
+            user = mysql.claim_one(table, {"age": 0}, {"age": 1},
+                                   orderby=mysql.ID)
+            self.assertEqual(user["name"], f"user_{k}")
+            user = mysql.find_one(table, {"name": f"user_{k}"})
+            self.assertEqual(user["age"], 1)
+        self.assertIsNone(mysql.claim_one(table, {"age": 0}, {"age": 1}))
+        self.assertEqual(mysql.count(table, {"age": 1}), count)
+
+        mysql.delete_table(table)
+        mysql.close()
+
+    def test_transaction(self):
+        mysql = self.new_db()
+        table = "test_transaction"
+        mysql.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+
+        with mysql.transaction():
+            mysql.add_one(table, {"name": "a", "age": 1})
+            with mysql.transaction():
+                mysql.add_one(table, {"name": "b", "age": 2})
+            self.assertTrue(mysql.in_transaction)
+        self.assertFalse(mysql.in_transaction)
+        self.assertEqual(mysql.count(table, {}), 2)
+
+        with self.assertRaises(KeyError):
+            with mysql.transaction():
+                mysql.add_one(table, {"name": "c", "age": 3})
+                mysql.pop_one(table, {"name": "a"})
+                raise KeyError("rollback")
+        self.assertEqual(mysql.count(table, {}), 2)
+        self.assertIsNone(mysql.find_one(table, {"name": "c"}))
+        self.assertIsNotNone(mysql.find_one(table, {"name": "a"}))
+        mysql.delete_table(table)
+        mysql.close()
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from skua.adapter.pool import ConnectionPool, PoolError
+from skua.adapter.sqlite import SQLiteDB
+from skua.adapter.database import DatabaseError
+from skua.bigdict import BigDict
+
+
+class FakeConn:
+    def __init__(self):
+        self.open = True
+
+    def close(self):
+        self.open = False
+
+
+class TestConnectionPool(unittest.TestCase):
+    def new_pool(self, **kwargs):
+        return ConnectionPool(FakeConn, is_open=lambda conn: conn.open,
+                              **kwargs)
+
+    def test_acquire_release(self):
+        pool = self.new_pool(max_size=2, min_size=1)
+        pool.fill()
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(pool.idle, 1)
+
+        a = pool.acquire()
+        b = pool.acquire()
+        self.assertIsNot(a, b)
+        self.assertEqual(pool.size, 2)
+        with self.assertRaises(PoolError):
+            pool.acquire(timeout=0.05)
+
+        pool.release(a)
+        self.assertIs(pool.acquire(), a)
+        pool.release(a)
+        pool.release(b)
+        self.assertEqual(pool.idle, 2)
+
+        pool.close()
+        self.assertFalse(a.open)
+        self.assertFalse(b.open)
+        with self.assertRaises(PoolError):
+            pool.acquire()
+
+    def test_wait_for_release(self):
+        pool = self.new_pool(max_size=1)
+        conn = pool.acquire()
+        timer = threading.Timer(0.1, pool.release, args=(conn,))
+        timer.start()
+        self.assertIs(pool.acquire(timeout=5), conn)
+        timer.join()
+
+    def test_health_check(self):
+        pool = self.new_pool(max_size=1)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.open = False
+        new_conn = pool.acquire()
+        self.assertIsNot(new_conn, conn)
+        self.assertEqual(pool.size, 1)
+
+    def test_idle_eviction(self):
+        pool = self.new_pool(max_size=3, min_size=1, idle_timeout=0.05)
+        conns = [pool.acquire() for _ in range(3)]
+        for conn in conns:
+            pool.release(conn)
+        self.assertEqual(pool.idle, 3)
+        time.sleep(0.1)
+        pool.acquire()
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(len([conn for conn in conns if conn.open]), 1)
+
+    def test_type_checker(self):
+        with self.assertRaises(ValueError):
+            self.new_pool(max_size=0)
+        with self.assertRaises(ValueError):
+            self.new_pool(max_size=1, min_size=2)
+
+
+class TestPooledSQLite(unittest.TestCase):
+    def test_memory_database(self):
+        sqlite = SQLiteDB(max_connections=2)
+        with self.assertRaises(DatabaseError):
+            sqlite.connect()
+
+    def test_thread_connections(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sqlite = SQLiteDB(max_connections=4)
+            sqlite.connect(os.path.join(tmp, "pool.db"))
+            bd = BigDict(sqlite)
+            bd.update({f"key_{k}": k for k in range(100)})
+
+            conns = set()
+            errors = []
+
+            def reader():
+                try:
+                    conns.add(id(sqlite.conn))
+                    for k in range(100):
+                        self.assertEqual(bd[f"key_{k}"], k)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=reader) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            self.assertEqual(errors, [])
+            self.assertGreater(len(conns), 1)
+            # Finished threads gave their connections back.
+            self.assertLessEqual(sqlite._pool.size, 4)
+            self.assertGreater(sqlite._pool.idle, 0)
+            sqlite.close()
@@ -0,0 +1,77 @@
+import pickle
+import unittest
+from skua.serializer import (PickleSerializer,
+                             JSONSerializer,
+                             MsgpackSerializer,
+                             RawSerializer,
+                             get_serializer,
+                             msgpack)
+
+
+class Payload:
+    # Exposes its data as an out-of-band buffer and keeps whatever
+    # buffer it is rebuilt from.
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        return (Payload, (pickle.PickleBuffer(self.data),))
+
+
+class TestSerializer(unittest.TestCase):
+    def test_pickle(self):
+        serializer = PickleSerializer()
+        obj = {"a": [1, 2.5, None], "b": ("x", b"y")}
+        self.assertEqual(serializer.loads(serializer.dumps(obj)), obj)
+        self.assertEqual(serializer.name, "pickle")
+        # Pickles of any older protocol still load.
+        self.assertEqual(serializer.loads(pickle.dumps(obj, 2)), obj)
+
+    def test_pickle_out_of_band(self):
+        serializer = PickleSerializer(out_of_band=True)
+        self.assertEqual(serializer.name, "pickle-oob")
+        data = bytearray(b"x" * 1000)
+        blob = serializer.dumps({"payload": Payload(data), "n": 1})
+        obj = serializer.loads(blob)
+        self.assertEqual(obj["n"], 1)
+        self.assertEqual(bytes(obj["payload"].data), bytes(data))
+        # The buffer is a view of the stored row, not a copy.
+        self.assertIsInstance(obj["payload"].data, memoryview)
+        self.assertIs(obj["payload"].data.obj, blob)
+
+        obj = serializer.loads(serializer.dumps([bytearray(b"ab"), "c"]))
+        self.assertEqual(obj, [bytearray(b"ab"), "c"])
+        with self.assertRaises(ValueError):
+            PickleSerializer(protocol=4, out_of_band=True)
+
+    def test_json(self):
+        serializer = JSONSerializer()
+        obj = {"a": [1, 2.5, None, "x"]}
+        data = serializer.dumps(obj)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(serializer.loads(data), obj)
+        with self.assertRaises(TypeError):
+            serializer.dumps(object())
+
+    @unittest.skipIf(msgpack is None, "msgpack not installed")
+    def test_msgpack(self):
+        serializer = MsgpackSerializer()
+        obj = {"a": [1, 2.5, None, "x"], "b": b"raw"}
+        self.assertEqual(serializer.loads(serializer.dumps(obj)), obj)
+
+    def test_raw(self):
+        serializer = RawSerializer()
+        data = b"\x00\x01raw"
+        self.assertIs(serializer.dumps(data), data)
+        self.assertIs(serializer.loads(data), data)
+        self.assertEqual(serializer.dumps(bytearray(data)), data)
+        with self.assertRaises(TypeError):
+            serializer.dumps("text")
+
+    def test_get_serializer(self):
+        self.assertIsInstance(get_serializer(), PickleSerializer)
+        self.assertIsInstance(get_serializer("json"), JSONSerializer)
+        serializer = RawSerializer()
+        self.assertIs(get_serializer(serializer), serializer)
+        with self.assertRaises(ValueError):
+            get_serializer("yaml")
@@ -0,0 +1,176 @@
+import os
+import tempfile
+import threading
+import unittest
+from queue import Empty
+from skua.adapter.sqlite import SQLiteDB
+from skua.shard import (HashRing,
+                        ShardedBigDict,
+                        ShardedBigSet,
+                        ShardedBigQueue)
+
+
+class TestHashRing(unittest.TestCase):
+    def test_balance(self):
+        ring = HashRing(range(4))
+        counts = [0] * 4
+        for k in range(4000):
+            counts[ring.get(f"key_{k}")] += 1
+        for n in counts:
+            self.assertTrue(600 < n < 1400)
+
+    def test_stable(self):
+        ring = HashRing(range(4))
+        grown = HashRing(range(5))
+        keys = [f"key_{k}" for k in range(2000)]
+        self.assertEqual([ring.get(key) for key in keys],
+                         [HashRing(range(4)).get(key) for key in keys])
+        # Only keys moving to the new node change place.
+        moved = [key for key in keys if ring.get(key) != grown.get(key)]
+        self.assertTrue(all(grown.get(key) == 4 for key in moved))
+        self.assertTrue(len(moved) < len(keys) / 3)
+
+
+class TestShardSQLite(unittest.TestCase):
+    def get_adapters(self, n):
+        adapters = []
+        for _ in range(n):
+            sqlite = SQLiteDB()
+            sqlite.connect()
+            adapters.append(sqlite)
+        return adapters
+
+    def test_dict(self):
+        bd = ShardedBigDict(self.get_adapters(3))
+        dic = {f"key_{k}": k for k in range(100)}
+        bd.update(dic)
+        bd["extra"] = -1
+        self.assertEqual(len(bd), 101)
+        self.assertEqual(bd["key_7"], 7)
+        self.assertIn("extra", bd)
+        del bd["extra"]
+        self.assertNotIn("extra", bd)
+        self.assertEqual(bd.get("extra", "none"), "none")
+        self.assertEqual(dict(bd.items(batch_size=7)), dic)
+        self.assertEqual(bd.pop("key_0"), 0)
+        # Every shard holds a share of the keys.
+        for shard in bd.shards:
+            self.assertTrue(len(shard) > 10)
+        key, value = bd.popitem()
+        self.assertEqual(dic[key], value)
+        bd.clear()
+        self.assertEqual(len(bd), 0)
+        with self.assertRaises(KeyError):
+            bd.popitem()
+        bd.delete()
+        bd.close()
+
+    def test_dict_one_adapter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sqlite = SQLiteDB()
+            sqlite.connect(os.path.join(tmp, "shard.db"))
+            bd = ShardedBigDict(sqlite, shards=4, name="skua_test_shard")
+            bd.update({f"key_{k}": k for k in range(50)})
+            self.assertEqual(len(bd), 50)
+            self.assertEqual([shard._table for shard in bd.shards],
+                             [f"skua_test_shard_{i}" for i in range(4)])
+            self.assertEqual(sorted(bd.values()), list(range(50)))
+            bd.close()
+
+            # The same key lands on the same shard when reopened.
+            sqlite = SQLiteDB()
+            sqlite.connect(os.path.join(tmp, "shard.db"))
+            bd = ShardedBigDict(sqlite, shards=4, name="skua_test_shard")
+            self.assertEqual(bd["key_42"], 42)
+            bd.delete()
+            bd.close()
+
+    def test_close_shared_adapter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "shard.db")
+            sqlite = SQLiteDB()
+            sqlite.connect(path)
+            bd = ShardedBigDict(sqlite, shards=4, name="skua_test_shard",
+                                write_behind=True, flush_interval=None)
+            for k in range(20):
+                bd[f"key_{k}"] = k
+            bd.close()
+            self.assertFalse(sqlite._connected)
+
+            sqlite = SQLiteDB()
+            sqlite.connect(path)
+            bd = ShardedBigDict(sqlite, shards=4, name="skua_test_shard")
+            self.assertEqual(len(bd), 20)
+            bd.delete()
+            bd.close()
+
+    def test_set(self):
+        bs = ShardedBigSet(self.get_adapters(3))
+        bs.update(range(60))
+        bs.add(0)
+        bs.add("spam")
+        self.assertEqual(len(bs), 61)
+        self.assertIn(5, bs)
+        self.assertIn("spam", bs)
+        # Equal members are routed to the same shard.
+        self.assertIn(5.0, bs)
+        self.assertIn(True, bs)
+        bs.remove("spam")
+        self.assertNotIn("spam", bs)
+        self.assertEqual(sorted(bs.members(batch_size=8)), list(range(60)))
+        self.assertIn(bs.pop(), range(60))
+        with self.assertRaises(TypeError):
+            bs.update(1)
+        bs.delete()
+        bs.close()
+
+    def test_queue(self):
+        queue = ShardedBigQueue(self.get_adapters(3))
+        queue.put_many(range(30))
+        for k in range(30, 36):
+            queue.put(k)
+        self.assertEqual(queue.qsize(), 36)
+        # Puts are spread round-robin.
+        for shard in queue.shards:
+            self.assertEqual(shard.qsize(), 12)
+        items = queue.get_many(20)
+        self.assertEqual(len(items), 20)
+        while not queue.empty():
+            items.append(queue.get())
+        self.assertEqual(sorted(items), list(range(36)))
+        with self.assertRaises(Empty):
+            queue.get_nowait()
+        with self.assertRaises(Empty):
+            queue.get(timeout=0.05)
+        for _ in items:
+            queue.task_done()
+        queue.join(timeout=1)
+        queue.delete()
+        queue.close()
+
+    def test_queue_steal(self):
+        queue = ShardedBigQueue(self.get_adapters(2))
+        results = []
+
+        def consume():
+            # Homes differ, but all items sit in one shard.
+            for _ in range(5):
+                results.append(queue.get(timeout=5))
+
+        queue.shards[0].put_many(range(10))
+        threads = [threading.Thread(target=consume) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), list(range(10)))
+
+        # A blocked get wakes up on a put.
+        thread = threading.Thread(target=consume)
+        thread.start()
+        for k in range(5):
+            queue.put(k)
+        thread.join()
+        self.assertEqual(len(results), 15)
+        queue.delete()
+        queue.close()
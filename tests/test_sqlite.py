@@ -1,5 +1,9 @@
+import os
 import unittest
 import random
+import tempfile
+import time
+import weakref
 from skua.adapter.sqlite import SQLiteDB
 from skua.adapter.database import (DatabaseError,
                                    DatabaseWarning)
@@ -303,3 +307,371 @@ class TestSQLite(unittest.TestCase):
         sqlite.delete_table(table)
         sqlite.close()
 
+    def test_legacy_table(self):
+        # Tables written before skua added an id column only have the
+        # implicit rowid.
+        sqlite = self.new_db()
+        table = "test_legacy_table"
+        sqlite.execute(f"CREATE TABLE {table} (name varchar(255), age int)")
+        sqlite.add_many(table, [{"name": random_str(5), "age": age}
+                                for age in range(25)])
+        results = list(sqlite.find_iter(table, batch_size=4))
+        self.assertEqual([result["age"] for result in results],
+                         list(range(25)))
+        result = sqlite.pop_one(table, {}, orderby=sqlite.ID)
+        self.assertEqual(result["age"], 0)
+        result = sqlite.claim_one(table, {}, {"age": 100},
+                                  orderby=sqlite.ID)
+        self.assertEqual(result["age"], 100)
+        sqlite.remove_by_ids(table, [result[sqlite.ID]])
+        self.assertEqual(sqlite.count(table), 23)
+        sqlite.delete_table(table)
+        sqlite.close()
+
+
+    def test_find_iter(self):
+        sqlite = self.new_db()
+        table = "test_find_iter"
+        count = 55
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        users = []
+        for _ in range(count):
+            users.append({"name": random_str(5),
+                          "age": random.randint(0, 100)})
+        sqlite.add_many(table, users)
+
+        users = list(sqlite.find_iter(table, {}, batch_size=7))
+        self.assertEqual(len(users), count)
+        ids = [user[sqlite.ID] for user in users]
+        self.assertEqual(ids, sorted(set(ids)))
+
+        where = {"age": sqlite.gt(50)}
+        users = list(sqlite.find_iter(table, where, batch_size=3))
+        self.assertEqual(len(users), sqlite.count(table, where))
+        for user in users:
+            self.assertGreater(user["age"], 50)
+
+        with self.assertRaises(ValueError):
+            list(sqlite.find_iter(table, {}, batch_size=0))
+
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_create_index(self):
+        sqlite = self.new_db()
+        table = "test_create_index"
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        self.assertFalse(sqlite.index_exist(table, ["name"]))
+        sqlite.create_index(table, ["name"], unique=True)
+        self.assertTrue(sqlite.index_exist(table, ["name"]))
+        with self.assertRaises(DatabaseWarning):
+            sqlite.create_index(table, ["name"], unique=True)
+
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_upsert(self):
+        sqlite = self.new_db()
+        table = "test_upsert"
+        count = 50
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        sqlite.create_index(table, ["name"], unique=True)
+
+        users = {}
+        for k in range(count):
+            name = f"user_{k}"
+            users[name] = random.randint(0, 100)
+            sqlite.upsert(table, {"name": name, "age": users[name]}, "name")
+
+        for name in users:
+            users[name] = random.randint(101, 200)
+            sqlite.upsert(table, {"name": name, "age": users[name]}, ["name"])
+
+        self.assertEqual(sqlite.count(table, {}), count)
+        for name, age in users.items():
+            user = sqlite.find_one(table, {"name": name})
+            self.assertEqual(user["age"], age)
+
+        sqlite.upsert(table, {"name": "user_0"}, ["name"])
+        self.assertEqual(sqlite.count(table, {}), count)
+
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_add_ignore(self):
+        sqlite = self.new_db()
+        table = "test_add_ignore"
+        count = 50
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        sqlite.create_index(table, ["name"], unique=True)
+
+        for k in range(count):
+            user = {"name": f"user_{k}", "age": k}
+            sqlite.add_ignore(table, user)
+            sqlite.add_ignore(table, {"name": f"user_{k}", "age": -1})
+
+        self.assertEqual(sqlite.count(table, {}), count)
+        self.assertEqual(sqlite.count(table, {"age": -1}), 0)
+
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_add_many_ignore_upsert_many(self):
+        sqlite = self.new_db()
+        table = "test_add_many_ignore"
+        count = 50
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        sqlite.create_index(table, ["name"], unique=True)
+
+        users = [{"name": f"user_{k % 20}", "age": k} for k in range(count)]
+        sqlite.add_many_ignore(table, users)
+        self.assertEqual(sqlite.count(table, {}), 20)
+        self.assertEqual(sqlite.count(table, {"age": sqlite.ge(20)}), 0)
+
+        users = [{"name": f"user_{k}", "age": k} for k in range(count)]
+        sqlite.upsert_many(table, users, ["name"])
+        self.assertEqual(sqlite.count(table, {}), count)
+        for k in range(count):
+            user = sqlite.find_one(table, {"name": f"user_{k}"})
+            self.assertEqual(user["age"], k)
+
+        sqlite.add_many_ignore(table, [])
+        sqlite.upsert_many(table, [], ["name"])
+        with self.assertRaises(TypeError):
+            sqlite.upsert_many(table, {}, ["name"])
+
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_remove_by_ids(self):
+        sqlite = self.new_db()
+        table = "test_remove_by_ids"
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        sqlite.add_many(table, [{"name": random_str(5), "age": k}
+                                for k in range(50)])
+        users = sqlite.find_many(table, {"age": sqlite.lt(20)})
+        sqlite.remove_by_ids(table, [user[sqlite.ID] for user in users])
+        self.assertEqual(sqlite.count(table, {}), 30)
+        self.assertEqual(sqlite.count(table, {"age": sqlite.lt(20)}), 0)
+        sqlite.remove_by_ids(table, [])
+        self.assertEqual(sqlite.count(table, {}), 30)
+
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_pop_one_pop_many(self):
+        sqlite = self.new_db()
+        table = "test_pop"
+        count = 50
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        users = [{"name": f"user_{k}", "age": random.randint(0, 10)}
+                 for k in range(count)]
+        sqlite.add_many(table, users)
+
+        user = sqlite.pop_one(table, {}, orderby=sqlite.ID)
+        self.assertEqual(user["name"], "user_0")
+        self.assertEqual(sqlite.count(table, {}), count - 1)
+
+        popped = sqlite.pop_many(table, {"age": sqlite.le(5)},
+                                 orderby=["age", sqlite.ID], limit=10)
+        self.assertLessEqual(len(popped), 10)
+        self.assertEqual(sqlite.count(table, {}), count - 1 - len(popped))
+        keys = [(user["age"], user[sqlite.ID]) for user in popped]
+        self.assertEqual(keys, sorted(keys))
+        for user in popped:
+            self.assertLessEqual(user["age"], 5)
+            self.assertIsNone(sqlite.find_one(table, {"name": user["name"]}))
+
+        popped = sqlite.pop_many(table, {}, orderby=sqlite.ID, limit=count)
+        self.assertEqual(len(popped), count - 1 - len(keys))
+        self.assertIsNone(sqlite.pop_one(table, {}, orderby=sqlite.ID))
+        self.assertEqual(sqlite.pop_many(table, {}, limit=5), [])
+
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_claim_one(self):
+        sqlite = self.new_db()
+        table = "test_claim_one"
+        count = 20
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        sqlite.add_many(table, [{"name": f"user_{k}", "age": 0}
+                                for k in range(count)])
+
+        for k in range(count):
+            user = sqlite.claim_one(table, {"age": 0}, {"age": 1},
+                                    orderby=sqlite.ID)
+            self.assertEqual(user["name"], f"user_{k}")
+            user = sqlite.find_one(table, {"name": f"user_{k}"})
+            self.assertEqual(user["age"], 1)
+        self.assertIsNone(sqlite.claim_one(table, {"age": 0}, {"age": 1}))
+        self.assertEqual(sqlite.count(table, {"age": 1}), count)
+
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_profile_pragmas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sqlite = SQLiteDB()
+            sqlite.connect(os.path.join(tmp, "profile.db"),
+                           profile="performance", cache_size=-1024)
+            mode = sqlite.conn.execute("PRAGMA journal_mode").fetchone()[0]
+            self.assertEqual(mode, "wal")
+            size = sqlite.conn.execute("PRAGMA cache_size").fetchone()[0]
+            self.assertEqual(size, -1024)
+            sqlite.close()
+
+        with self.assertRaises(ValueError):
+            SQLiteDB().connect(profile="unknown")
+        with self.assertRaises(ValueError):
+            SQLiteDB().connect(foreign_keys="ON")
+        with self.assertRaises(DatabaseError):
+            SQLiteDB().connect(readers=2)
+
+    def test_readers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sqlite = SQLiteDB()
+            sqlite.connect(os.path.join(tmp, "readers.db"),
+                           profile="performance", readers=2)
+            table = "test_readers"
+            sqlite.create_table(table, {
+                "name": "varchar(255)",
+                "age" : "int"})
+            sqlite.add_one(table, {"name": "reader", "age": 1})
+
+            # A write transaction in progress does not block readers,
+            # which keep seeing the last committed state.
+            sqlite.conn.execute("BEGIN IMMEDIATE")
+            sqlite.conn.execute(f"UPDATE {table} SET age=2")
+            user = sqlite.find_one(table, {"name": "reader"})
+            self.assertEqual(user["age"], 1)
+            self.assertEqual(sqlite.count(table, {}), 1)
+            sqlite.conn.commit()
+
+            user = sqlite.find_one(table, {"name": "reader"})
+            self.assertEqual(user["age"], 2)
+            self.assertGreater(sqlite._readers.size, 0)
+            sqlite.close()
+
+    def test_transaction(self):
+        sqlite = self.new_db()
+        table = "test_transaction"
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+
+        with sqlite.transaction():
+            sqlite.add_one(table, {"name": "a", "age": 1})
+            with sqlite.transaction():
+                sqlite.add_one(table, {"name": "b", "age": 2})
+            self.assertTrue(sqlite.in_transaction)
+        self.assertFalse(sqlite.in_transaction)
+        self.assertEqual(sqlite.count(table, {}), 2)
+
+        with self.assertRaises(KeyError):
+            with sqlite.transaction():
+                sqlite.add_one(table, {"name": "c", "age": 3})
+                sqlite.pop_one(table, {"name": "a"})
+                raise KeyError("rollback")
+        self.assertEqual(sqlite.count(table, {}), 2)
+        self.assertIsNone(sqlite.find_one(table, {"name": "c"}))
+        self.assertIsNotNone(sqlite.find_one(table, {"name": "a"}))
+        sqlite.delete_table(table)
+        sqlite.close()
+
+    def test_group_commit(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "group.db")
+            writer, reader = SQLiteDB(), SQLiteDB()
+            writer.connect(path)
+            reader.connect(path)
+            table = "test_group_commit"
+            writer.create_table(table, {
+                "name": "varchar(255)",
+                "age" : "int"})
+
+            writer.group_commit(every=3)
+            writer.add_one(table, {"name": "a", "age": 1})
+            writer.add_one(table, {"name": "b", "age": 2})
+            # Deferred writes are visible to the writer only.
+            self.assertEqual(writer.count(table, {}), 2)
+            self.assertEqual(reader.count(table, {}), 0)
+            writer.add_one(table, {"name": "c", "age": 3})
+            self.assertEqual(reader.count(table, {}), 3)
+
+            writer.add_one(table, {"name": "d", "age": 4})
+            self.assertEqual(reader.count(table, {}), 3)
+            writer.flush()
+            self.assertEqual(reader.count(table, {}), 4)
+
+            writer.group_commit(interval=0)
+            writer.add_one(table, {"name": "e", "age": 5})
+            self.assertEqual(reader.count(table, {}), 5)
+
+            # A lone write is committed by the timer.
+            writer.group_commit(interval=0.05)
+            writer.add_one(table, {"name": "f", "age": 6})
+            self.assertEqual(reader.count(table, {}), 5)
+            time.sleep(0.3)
+            self.assertEqual(reader.count(table, {}), 6)
+            reader.add_one(table, {"name": "g", "age": 7})
+
+            writer.group_commit(every=100)
+            writer.add_one(table, {"name": "h", "age": 8})
+            with self.assertRaises(ValueError):
+                writer.group_commit(every=0)
+            writer.close()
+            self.assertEqual(reader.count(table, {}), 8)
+            reader.close()
+
+    def test_sql_cache(self):
+        sqlite = self.new_db()
+        table = "test_sql_cache"
+        sqlite.create_table(table, {
+            "name": "varchar(255)",
+            "age" : "int"})
+        sqlite.add_one(table, {"name": "<b>'x'", "age": 1})
+        sqlite.add_one(table, {"name": "y", "age": 2})
+
+        # Values are bound, so quotes and operator-like strings match
+        # literally and every lookup reuses one statement text.
+        sqlite._sql_cache.clear()
+        before = sqlite._sql_cache.info()
+        self.assertEqual(sqlite.find_one(table, {"name": "<b>'x'"})["age"], 1)
+        self.assertEqual(sqlite.find_one(table, {"name": "y"})["age"], 2)
+        self.assertEqual(sqlite.count(table, {"age": sqlite.gt(1)}), 1)
+        self.assertEqual(sqlite.count(table, {"age": sqlite.gt(0)}), 2)
+        info = sqlite._sql_cache.info()
+        self.assertEqual((info.hits - before.hits,
+                          info.misses - before.misses), (2, 2))
+        self.assertEqual(sqlite.count(table, {"age": sqlite.eq(2)}), 1)
+
+        sqlite.update(table, {"name": "z'"}, {"age": 2})
+        self.assertEqual(sqlite.find_one(table, {"age": 2})["name"], "z'")
+        sqlite.remove(table, {"name": "<b>'x'"})
+        self.assertEqual(sqlite.count(table, {}), 1)
+        self.assertEqual(sqlite.gt(5), ">5")
+        self.assertEqual(sqlite.eq(5), "=5")
+        sqlite.delete_table(table)
+        sqlite.close()
+
+        # No reference cycle keeps a closed adapter alive.
+        ref = weakref.ref(sqlite)
+        del sqlite
+        self.assertIsNone(ref())